@@ -6,9 +6,11 @@ import datetime
 import importlib
 import inspect
 import logging
+import multiprocessing
+import os
 from pathlib import Path
 import tempfile
-from typing import List, Optional
+from typing import Optional
 
 import pandas as pd
 
@@ -16,6 +18,34 @@ import reporter
 
 logger = logging.getLogger(__name__)
 
+# The number of logical CPUs this process can run on. On Linux this respects the CPU
+# affinity, e.g. the cpuset a container is limited to, contrary to cpu_count().
+if hasattr(os, "sched_getaffinity"):
+    NB_CPUS_AVAILABLE = len(os.sched_getaffinity(0))
+else:
+    NB_CPUS_AVAILABLE = multiprocessing.cpu_count()
+
+
+def cap_nb_parallel(requested: int) -> int:
+    """Cap the nb_parallel requested to the number of logical CPUs available.
+
+    A warning is logged if the nb_parallel requested is capped.
+
+    Args:
+        requested (int): the nb_parallel requested.
+
+    Returns:
+        int: the nb_parallel to use.
+    """
+    if NB_CPUS_AVAILABLE < requested:
+        logger.warning(
+            f"nb_parallel specified ({requested}) > nb logical cores available "
+            f"({NB_CPUS_AVAILABLE}), so only use the cores available"
+        )
+        return NB_CPUS_AVAILABLE
+
+    return requested
+
 
 class RunResult:
     """The result of a benchmark run."""
@@ -57,8 +87,9 @@ def run_benchmarks(
     benchmarks_subdir: str = "benchmarks",
     results_subdir: str = "results",
     results_filename: str = "benchmark_results.csv",
-    modules: Optional[List[str]] = None,
-    functions: Optional[List[str]] = None,
+    modules: Optional[list[str]] = None,
+    functions: Optional[list[str]] = None,
+    tmp_dir: Optional[Path] = None,
 ):
     # Init logging
     logging.basicConfig(
@@ -68,7 +99,11 @@ def run_benchmarks(
     )
 
     # Discover and run all benchmark implementations
-    tmp_dir = Path(tempfile.gettempdir()) / "geobenchmark"
+    # The test data and the output files are written to tmp_dir. Writing the output is
+    # part of the benchmarks, so by default a regular (disk) tmp dir is used, but e.g. a
+    # RAM disk like /dev/shm can be specified to exclude the disk speed.
+    if tmp_dir is None:
+        tmp_dir = Path(tempfile.gettempdir()) / "geobenchmark"
     logger.info(f"tmpdir: {tmp_dir}")
     tmp_dir.mkdir(parents=True, exist_ok=True)
 
@@ -93,6 +128,9 @@ def run_benchmarks(
             for function_name, function in available_functions:
                 if function_name.startswith("_"):
                     continue
+                if function.__module__ != benchmark_implementation.__name__:
+                    # Imported from elsewhere, so not a benchmark
+                    continue
                 if functions is not None and function_name not in functions:
                     # Function whitelist specified, and this one isn't in it
                     logger.info(
@@ -103,7 +141,7 @@ def run_benchmarks(
                 # Run the benchmark function
                 logger.info(f"{benchmarks_subdir}.{module_name}.{function_name} start")
                 function_results = function(tmp_dir=tmp_dir)
-                if isinstance(function_results, List) is False:
+                if isinstance(function_results, list) is False:
                     function_results = [function_results]
                 for function_result in function_results:
                     if isinstance(function_result, RunResult) is True:
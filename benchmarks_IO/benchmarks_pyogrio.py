@@ -3,13 +3,14 @@
 Module to benchmark geopandas operations using pyogrio for IO.
 """
 
-from datetime import datetime
-import itertools
+import gc
 import logging
-import os
 from pathlib import Path
+import time
+from typing import Optional, Union
+
+import geopandas as gpd
 import pyogrio
-from typing import List
 
 from benchmarker import RunResult
 import testdata
@@ -20,6 +21,19 @@ import testdata
 
 logger = logging.getLogger(__name__)
 
+# Use the (much faster) column oriented arrow IO if GDAL supports it (GDAL >= 3.6)
+_use_arrow = pyogrio.__gdal_version__ >= (3, 6, 0)
+_READ_KWARGS = {"use_arrow": _use_arrow}
+_WRITE_KWARGS = {"use_arrow": _use_arrow}
+
+# Number of times each write configuration is benchmarked
+_nb_runs = 3
+
+# SQLite pragma's that have no effect when writing to GDAL's in-memory file system:
+# there is no fsync to skip, and GDAL's SQLite VFS supports neither memory mapping nor
+# the shared memory WAL needs. Configurations using them only run on disk.
+_VSIMEM_NOOP_PRAGMAS = ("synchronous=", "mmap_size=", "journal_mode=WAL")
+
 ################################################################################
 # The real work
 ################################################################################
@@ -33,34 +47,68 @@ def _get_version() -> str:
     return f"{pyogrio.__version__}".replace("v", "")
 
 
-class set_env_variables(object):
-    def __init__(self, env_variables_to_set: dict):
-        self.env_variables_backup: dict[str, str] = {}
-        self.env_variables_to_set = env_variables_to_set
+class set_config_options(object):
+    def __init__(self, config_options_to_set: dict):
+        self.config_options_backup: dict[str, Optional[str]] = {}
+        self.config_options_to_set = config_options_to_set
 
     def __enter__(self):
-        # Only if a name and value is specified...
-        for name, value in self.env_variables_to_set.items():
-            # If the environment variable is already defined, make backup
-            if name in os.environ:
-                self.env_variables_backup[name] = os.environ[name]
-
-            # Set env variable to value
-            os.environ[name] = value
+        # Set the options directly in GDAL: cheaper than via environment variables,
+        # and doesn't interfere with other users of os.environ.
+        for name in self.config_options_to_set:
+            self.config_options_backup[name] = pyogrio.get_gdal_config_option(name)
+        pyogrio.set_gdal_config_options(self.config_options_to_set)
 
     def __exit__(self, type, value, traceback):
-        # Set variables that were backed up back to original value
-        for name, value in self.env_variables_backup.items():
-            # Recover backed up value
-            os.environ[name] = value
-        # For variables without backup, remove them
-        for name, value in self.env_variables_to_set.items():
-            if name not in self.env_variables_backup:
-                if name in os.environ:
-                    del os.environ[name]
-
-
-def write_dataframe(tmp_dir: Path) -> List[RunResult]:
+        # Set the options back to their original value, None unsets an option
+        pyogrio.set_gdal_config_options(self.config_options_backup)
+
+
+def _write(
+    input_gdf: gpd.GeoDataFrame,
+    output_path: Union[str, Path],
+    config_options: dict,
+    spatial_index: str,
+) -> float:
+    """Write the GeoDataFrame to a GPKG file with the GDAL config options set.
+
+    The output file is removed again afterwards.
+
+    Args:
+        input_gdf (gpd.GeoDataFrame): the data to write.
+        output_path (Union[str, Path]): the file to write to. Can be a /vsimem/ path.
+        config_options (dict): the GDAL config options to set while writing.
+        spatial_index (str): "YES" to create a spatial index, "NO" to not create one.
+
+    Returns:
+        float: the seconds the write took.
+    """
+    # Disable the garbage collector, so its pauses don't disturb the timing
+    gc.disable()
+    try:
+        start_time = time.perf_counter()
+        with set_config_options(config_options):
+            pyogrio.write_dataframe(
+                input_gdf,
+                output_path,
+                layer=Path(output_path).stem,
+                driver="GPKG",
+                layer_options={"SPATIAL_INDEX": spatial_index},
+                **_WRITE_KWARGS,
+            )
+        secs_taken = time.perf_counter() - start_time
+    finally:
+        gc.enable()
+
+    if isinstance(output_path, Path):
+        output_path.unlink()
+    else:
+        pyogrio.vsi_unlink(output_path)
+
+    return secs_taken
+
+
+def write_dataframe(tmp_dir: Path) -> list[RunResult]:
     # Init
     results = []
     (
@@ -70,54 +118,110 @@ def write_dataframe(tmp_dir: Path) -> List[RunResult]:
 
     # Go!
     # Read input files
-    input_gdf = pyogrio.read_dataframe(input_path)
+    input_gdf = pyogrio.read_dataframe(input_path, **_READ_KWARGS)
 
     # Operation = write
-    output_path = tmp_dir / f"{input_path.stem}_write_dataframe_{_get_package()}.gpkg"
-
-    # Make combinations of all possible pragma's that could be used
-    sqlite_possible_pragmas = {
-        "temp_store=MEMORY": "Store temp results in memory",
-        "journal_mode=OFF": "Don't use any transaction log",
-        "locking_mode=EXCLUSIVE": "Locking mode exclusive -> no concurrent reading",
-        "synchronous=OFF": "Don't flush to disk",
-        "mmap_size=30000000000": "Use memory mapped IO (max 30GB)",
+    # Most pragma's only act on the disk IO, so all configurations are written to
+    # tmp_dir, which can be pointed to a RAM disk to exclude the disk speed. The cache
+    # size and spatial index axes are only swept in GDAL's in-memory file system, for
+    # the configurations with pragma's that have an effect there, to keep the number of
+    # writes limited.
+    output_name = f"{input_path.stem}_write_dataframe_{_get_package()}.gpkg"
+    output_path_vsimem = f"/vsimem/{output_name}"
+    output_path_disk = tmp_dir / output_name
+
+    # Curated pragma configurations: each tuning knob on its own + the combinations
+    # that are typically recommended for bulk writes.
+    sqlite_pragma_configs = {
+        "baseline": [],
+        "journal_off": ["journal_mode=OFF"],
+        "sync_off": ["synchronous=OFF"],
+        "temp_mem": ["temp_store=MEMORY"],
+        "mmap_only": ["mmap_size=268435456"],
+        "cache_only": ["cache_size=-200000"],
+        "wal_normal_cache": [
+            "journal_mode=WAL",
+            "synchronous=NORMAL",
+            "cache_size=-200000",
+        ],
+        "all_combined": [
+            "journal_mode=OFF",
+            "synchronous=OFF",
+            "temp_store=MEMORY",
+            "cache_size=-200000",
+            "mmap_size=268435456",
+        ],
     }
 
-    sqlite_pragma_combinations_tmp = []
-    for lengths in range(0, len(sqlite_possible_pragmas) + 1):
-        for subset in itertools.combinations(sqlite_possible_pragmas, lengths):
-            sqlite_pragma_combinations_tmp.append(list(subset))
-
-    # Now additionally add some different values for the cache_size pragma
-    sqlite_caches_sizes = {
-        None: "no Cache size",
-        "cache_size=-100000": "Set cache size, in KB",
-        "cache_size=-50000": "Set cache size, in KB",
-        "cache_size=-30000": "Set cache size, in KB",
-        "cache_size=-10000": "Set cache size, in KB",
-    }
-    sqlite_pragma_combinations = []
-    for sqlite_pragma_combination in sqlite_pragma_combinations_tmp:
-        for sqlite_caches_size in sqlite_caches_sizes:
-            if sqlite_caches_size is None:
-                sqlite_pragma_combinations.append(sqlite_pragma_combination)
-            else:
-                sqlite_pragma_combinations.append(
-                    [sqlite_caches_size] + list(sqlite_pragma_combination)
-                )
-
-    print(f"Nb pragma combinations found: {len(sqlite_pragma_combinations)}")
-
-    for combination_id, sqlite_pragmas in enumerate(sqlite_pragma_combinations):
+    # The size of the SQLite cache GDAL uses (in MB), independent of the pragma's.
+    # Especially relevant for the creation of the spatial index.
+    ogr_sqlite_cache_sizes = [None, "50", "200", "512"]
+
+    # Building the spatial index is a large part of the write time: benchmark with and
+    # without, to see the effect of the options on the inserts and the index apart.
+    spatial_index_options = ["YES", "NO"]
+
+    # Run every configuration a few times to reduce the noise on the results
+    write_runs = [
+        (
+            config_name,
+            sqlite_pragmas,
+            cache_size,
+            spatial_index,
+            output_path_vsimem,
+            run_id,
+            _nb_runs,
+        )
+        for spatial_index in spatial_index_options
+        for cache_size in ogr_sqlite_cache_sizes
+        for config_name, sqlite_pragmas in sqlite_pragma_configs.items()
+        if not any(pragma.startswith(_VSIMEM_NOOP_PRAGMAS) for pragma in sqlite_pragmas)
+        for run_id in range(_nb_runs)
+    ]
+    write_runs_disk = [
+        (
+            config_name,
+            sqlite_pragmas,
+            None,
+            "YES",
+            output_path_disk,
+            run_id,
+            _nb_runs,
+        )
+        for config_name, sqlite_pragmas in sqlite_pragma_configs.items()
+        for run_id in range(_nb_runs)
+    ]
+
+    def get_config_options(sqlite_pragmas: list[str], cache_size: Optional[str]):
+        config_options = {"OGR_SQLITE_PRAGMA": ",".join(sqlite_pragmas)}
+        if cache_size is not None:
+            config_options["OGR_SQLITE_CACHE"] = cache_size
+        return config_options
+
+    for write_run in write_runs + write_runs_disk:
+        (
+            config_name,
+            sqlite_pragmas,
+            cache_size,
+            spatial_index,
+            output_path,
+            run_id,
+            nb_runs,
+        ) = write_run
+        config_options = get_config_options(sqlite_pragmas, cache_size)
+        secs_taken = _write(input_gdf, output_path, config_options, spatial_index)
         sqlite_pragma_str = ",".join(sqlite_pragmas)
-        start_time = datetime.now()
-        with set_env_variables({"OGR_SQLITE_PRAGMA": sqlite_pragma_str}):
-            pyogrio.write_dataframe(
-                input_gdf, output_path, layer=output_path.stem, driver="GPKG"
-            )
-
-        secs_taken = (datetime.now() - start_time).total_seconds()
+        target = "disk" if isinstance(output_path, Path) else "vsimem"
+        run_details = {
+            "config": config_name,
+            "pragmas": sqlite_pragma_str,
+            "ogr_sqlite_cache": cache_size,
+            "spatial_index": spatial_index,
+            "use_arrow": _WRITE_KWARGS["use_arrow"],
+            "target": target,
+        }
+        if testdata.HILBERT_SORTED:
+            run_details["hilbert_sorted"] = True
         results.append(
             RunResult(
                 package=_get_package(),
@@ -127,16 +231,15 @@ def write_dataframe(tmp_dir: Path) -> List[RunResult]:
                 operation_descr=(
                     "write_dataframe of agri parcel layers BEFL (~500k polygons)"
                 ),
-                run_details={"pragmas": sqlite_pragma_str},
+                run_details=run_details,
             )
         )
 
         logger.info(
-            f"write took: {secs_taken:.2f}s for "
-            f"{combination_id}/{len(sqlite_pragma_combinations)}, "
-            f"with pragma's <{sqlite_pragma_str}>"
+            f"write took: {secs_taken:.2f}s for {config_name} to {target}, run "
+            f"{run_id + 1}/{nb_runs}, with pragma's <{sqlite_pragma_str}>, "
+            f"OGR_SQLITE_CACHE={cache_size} and SPATIAL_INDEX={spatial_index}"
         )
-        output_path.unlink()
 
     # Return
     return results
@@ -0,0 +1,391 @@
+"""
+Module with helper functions shared by the vector ops benchmarks.
+"""
+
+import atexit
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import os
+from pathlib import Path
+import sqlite3
+import time
+from typing import Optional, Union
+import uuid
+
+import geofileops as gfo
+import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+
+from benchmarker import RunResult
+import testdata
+
+# The versions of the libraries doing the heavy lifting underneath the packages
+# benchmarked. E.g. a GEOS upgrade can have a large impact on the overlay timings.
+LIB_VERSIONS = {
+    "geos": shapely.geos_version_string,
+    "gdal": pyogrio.__gdal_version_string__,
+    "sqlite": sqlite3.sqlite_version,
+}
+
+# The file format the benchmarks that support it write their output to: "GPKG",
+# "FlatGeobuf" or "Parquet". GPKG is the typical geo file format, but for CPU-bound
+# benchmarks the SQLite overhead can dominate the time taken. Can be overruled with the
+# GEOBENCHMARK_OUTPUT_FORMAT environment variable.
+OUTPUT_FORMAT = os.environ.get("GEOBENCHMARK_OUTPUT_FORMAT", "GPKG")
+_OUTPUT_SUFFIXES = {"GPKG": ".gpkg", "FlatGeobuf": ".fgb", "Parquet": ".parquet"}
+
+# The nb_parallel values to run the benchmarks that support it with, to see how they
+# scale. Can be set as a comma separated list with the GEOBENCHMARK_NB_PARALLEL_SWEEP
+# environment variable, e.g. "1,2,4,8,12". By default, they only run with the
+# nb_parallel of the benchmark module.
+NB_PARALLEL_SWEEP = (
+    [int(value) for value in os.environ["GEOBENCHMARK_NB_PARALLEL_SWEEP"].split(",")]
+    if "GEOBENCHMARK_NB_PARALLEL_SWEEP" in os.environ
+    else None
+)
+
+# Tolerance to simplify the generated complex polygons with before they are used in the
+# benchmarks. The overlay cost depends heavily on the number of points, so this allows
+# to compare with the unsimplified polygons. Can be set with the
+# GEOBENCHMARK_SIMPLIFY_COMPLEXPOLYS environment variable, by default they aren't
+# simplified.
+COMPLEXPOLYS_SIMPLIFY_TOLERANCE = (
+    float(os.environ["GEOBENCHMARK_SIMPLIFY_COMPLEXPOLYS"])
+    if "GEOBENCHMARK_SIMPLIFY_COMPLEXPOLYS" in os.environ
+    else None
+)
+
+# GDAL config options to speed up writing GPKG files: the benchmark output files are
+# temporary, so there is no need for durability.
+GPKG_WRITE_CONFIG_OPTIONS = {
+    "OGR_SQLITE_SYNCHRONOUS": "OFF",
+    "OGR_SQLITE_JOURNAL": "MEMORY",
+    # Cache size in MB
+    "OGR_SQLITE_CACHE": "200",
+}
+
+# GDAL config options to speed up reading GPKG files: SQLite reads the pages via a
+# memory map instead of copying them to its own page cache. The size is the maximum
+# size mapped, so it should be larger than the input files.
+GPKG_READ_CONFIG_OPTIONS = {"OGR_SQLITE_PRAGMA": f"mmap_size={1024**3}"}
+
+
+# The output files are removed in the background, so the next benchmark doesn't need to
+# wait for it. All removals are finished before the process exits.
+_remove_pool = ThreadPoolExecutor(max_workers=1)
+atexit.register(_remove_pool.shutdown, wait=True)
+
+
+@contextmanager
+def gdal_config_options(options: dict[str, Optional[str]]) -> Iterator[None]:
+    """Context manager to temporarily set GDAL config options.
+
+    Args:
+        options (dict[str, Optional[str]]): the config options to set. If a value is
+            None, the option is unset.
+    """
+    backup = {name: pyogrio.get_gdal_config_option(name) for name in options}
+    pyogrio.set_gdal_config_options(options)
+    try:
+        yield
+    finally:
+        pyogrio.set_gdal_config_options(backup)
+
+
+@contextmanager
+def gdal_config_env(options: dict[str, Optional[str]]) -> Iterator[None]:
+    """Context manager to temporarily set GDAL config options as environment variables.
+
+    Contrary to `gdal_config_options`, the options are also picked up by GDAL in worker
+    processes started while they are set, e.g. by geofileops.
+
+    Args:
+        options (dict[str, Optional[str]]): the config options to set. If a value is
+            None, the option is unset.
+    """
+    backup = {name: os.environ.get(name) for name in options}
+    _set_env(options)
+    try:
+        yield
+    finally:
+        _set_env(backup)
+
+
+def _set_env(variables: dict[str, Optional[str]]):
+    for name, value in variables.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+def sweep_nb_parallel(
+    func: Callable[..., RunResult],
+) -> Callable[..., Union[RunResult, list[RunResult]]]:
+    """Decorator to run a benchmark for all nb_parallel values in `NB_PARALLEL_SWEEP`.
+
+    The benchmark function should accept an `nb_parallel` keyword argument. If no
+    sweep is asked, the function is returned as it is.
+
+    Args:
+        func (Callable[..., RunResult]): the benchmark function.
+
+    Returns:
+        Callable[..., Union[RunResult, list[RunResult]]]: the benchmark function, that
+            returns a RunResult per nb_parallel value if a sweep is asked.
+    """
+    if NB_PARALLEL_SWEEP is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(tmp_dir: Path) -> list[RunResult]:
+        return [func(tmp_dir, nb_parallel=nb) for nb in NB_PARALLEL_SWEEP]
+
+    return wrapper
+
+
+def force_multipolygon(geoms: np.ndarray) -> np.ndarray:
+    """Convert all Polygons in the array to MultiPolygons, in place.
+
+    The conversion is vectorized, so no python loop is needed over the geometries.
+
+    Args:
+        geoms (np.ndarray): the geometries to convert.
+
+    Returns:
+        np.ndarray: the converted geometries, being the same array as `geoms`.
+    """
+    is_polygon = shapely.get_type_id(geoms) == shapely.GeometryType.POLYGON
+    geoms[is_polygon] = shapely.multipolygons(geoms[is_polygon][:, np.newaxis])
+
+    return geoms
+
+
+@functools.cache
+def _prewarm(path: Path):
+    """Do a tiny read and buffer, so the library initialization isn't timed.
+
+    The first GDAL and GEOS calls in a process pay for e.g. registering the drivers
+    and initializing PROJ. This only needs to be done once, so it shouldn't be
+    attributed to the first benchmark that happens to run.
+
+    Args:
+        path (Path): the file to read a feature of.
+    """
+    gdf = pyogrio.read_dataframe(path, max_features=1, use_arrow=True)
+    shapely.buffer(gdf.geometry.to_numpy(), 1)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_dataframe(
+    path: Path, columns: Optional[tuple[str, ...]]
+) -> tuple[gpd.GeoDataFrame, float]:
+    _prewarm(path)
+    start_time = time.perf_counter()
+    gdf = pyogrio.read_dataframe(path, columns=columns, use_arrow=True)
+    return gdf, time.perf_counter() - start_time
+
+
+def read_dataframe(
+    path: Path, columns: Optional[list[str]] = None
+) -> tuple[gpd.GeoDataFrame, float]:
+    """Read the file into a GeoDataFrame.
+
+    See `read_dataframes` for more details.
+
+    Args:
+        path (Path): the file to read.
+        columns (list[str], optional): the attribute columns to read. If None, all
+            columns are read. Defaults to None.
+
+    Returns:
+        tuple[gpd.GeoDataFrame, float]: the GeoDataFrame + the seconds the read took.
+    """
+    gdfs, secs_read = read_dataframes([path], columns=columns)
+    return gdfs[0], secs_read
+
+
+def read_dataframes(
+    paths: list[Path], columns: Optional[list[str]] = None
+) -> tuple[list[gpd.GeoDataFrame], float]:
+    """Read the files into GeoDataFrames concurrently.
+
+    pyogrio releases the GIL while reading, so the reads overlap. GPKG files are read
+    via a memory map, see `GPKG_READ_CONFIG_OPTIONS`.
+
+    The data read is cached, so consecutive benchmarks on the same files don't need
+    to read and parse them again. Reading the input is part of the benchmarks though,
+    so the seconds the original read took are returned, also if the cached data is
+    used. A copy of the cached data is returned, so it can be changed safely.
+
+    Only reading the attribute columns that are actually needed avoids decoding them
+    and moving them around in the benchmarked operations.
+
+    Args:
+        paths (list[Path]): the files to read.
+        columns (list[str], optional): the attribute columns to read. If None, all
+            columns are read. Use [] to only read the geometry. Defaults to None.
+
+    Returns:
+        tuple[list[gpd.GeoDataFrame], float]: the GeoDataFrames, in the order of
+            `paths` + the seconds the (concurrent) read took.
+    """
+    columns_key = tuple(columns) if columns is not None else None
+    with (
+        gdal_config_options(GPKG_READ_CONFIG_OPTIONS),
+        ThreadPoolExecutor(max_workers=len(paths)) as pool,
+    ):
+        results = list(pool.map(lambda path: _read_dataframe(path, columns_key), paths))
+
+    gdfs = [gdf.copy() for gdf, _ in results]
+    secs_read = max(secs for _, secs in results)
+    return gdfs, secs_read
+
+
+def write_gpkg(gdf: gpd.GeoDataFrame, path: Path, layer: Optional[str] = None):
+    """Write the GeoDataFrame to a GPKG file as fast as possible.
+
+    The data is written using the arrow path, with SQLite tuned for bulk inserts. The
+    spatial index is only created once all data has been written. Single geometries
+    are promoted to multi geometries while writing, so no harmonization is needed.
+
+    Args:
+        gdf (gpd.GeoDataFrame): the data to write.
+        path (Path): the GPKG file to write to.
+        layer (str, optional): the layer name. If None, the stem of `path` is used.
+            Defaults to None.
+    """
+    if layer is None:
+        layer = path.stem
+
+    with gdal_config_options(GPKG_WRITE_CONFIG_OPTIONS):
+        pyogrio.write_dataframe(
+            gdf,
+            path,
+            layer=layer,
+            driver="GPKG",
+            use_arrow=True,
+            promote_to_multi=True,
+            layer_options={"SPATIAL_INDEX": "NO"},
+        )
+        gfo.create_spatial_index(path, layer=layer)
+
+
+def write_result(gdf: gpd.GeoDataFrame, path: Path) -> Path:
+    """Write the benchmark result to a file in `OUTPUT_FORMAT`.
+
+    Args:
+        gdf (gpd.GeoDataFrame): the data to write.
+        path (Path): the file to write to. The suffix is replaced by the one of
+            `OUTPUT_FORMAT`.
+
+    Raises:
+        ValueError: if `OUTPUT_FORMAT` is not supported.
+
+    Returns:
+        Path: the file that was written.
+    """
+    if OUTPUT_FORMAT not in _OUTPUT_SUFFIXES:
+        raise ValueError(
+            f"unsupported OUTPUT_FORMAT: {OUTPUT_FORMAT}, "
+            f"expected one of {list(_OUTPUT_SUFFIXES)}"
+        )
+
+    path = path.with_suffix(_OUTPUT_SUFFIXES[OUTPUT_FORMAT])
+    if OUTPUT_FORMAT == "GPKG":
+        write_gpkg(gdf, path)
+    elif OUTPUT_FORMAT == "FlatGeobuf":
+        pyogrio.write_dataframe(
+            gdf,
+            path,
+            layer=path.stem,
+            driver="FlatGeobuf",
+            use_arrow=True,
+            promote_to_multi=True,
+        )
+    else:
+        gdf.to_parquet(path)
+
+    return path
+
+
+def remove_output(path: Path):
+    """Remove a benchmark output file in the background.
+
+    The file is renamed first, so a next benchmark can write to the same path right
+    away without its output being removed.
+
+    Args:
+        path (Path): the output file to remove. If it doesn't exist, nothing is done.
+    """
+    remove_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.remove")
+    try:
+        path.rename(remove_path)
+    except FileNotFoundError:
+        return
+
+    _remove_pool.submit(remove_path.unlink, missing_ok=True)
+
+
+def output_run_details(run_details: Optional[dict] = None) -> Optional[dict]:
+    """Add the output format to the run details if it isn't GPKG.
+
+    Results written to GPKG don't get the extra detail, so they stay comparable with
+    the results of before the output format could be chosen.
+
+    Args:
+        run_details (dict, optional): the run details to add the output format to.
+            Defaults to None.
+
+    Returns:
+        Optional[dict]: the run details.
+    """
+    if OUTPUT_FORMAT == "GPKG":
+        return run_details
+
+    return {**(run_details or {}), "output_format": OUTPUT_FORMAT}
+
+
+def complexpolys_run_details(run_details: Optional[dict] = None) -> Optional[dict]:
+    """Add the simplify tolerance of the complex polygons to the run details if set.
+
+    Results with the unsimplified complex polygons don't get the extra detail, so they
+    stay comparable with the results of before they could be simplified.
+
+    Args:
+        run_details (dict, optional): the run details to add the tolerance to.
+            Defaults to None.
+
+    Returns:
+        Optional[dict]: the run details.
+    """
+    if COMPLEXPOLYS_SIMPLIFY_TOLERANCE is None:
+        return run_details
+
+    return {
+        **(run_details or {}),
+        "simplify_tolerance": COMPLEXPOLYS_SIMPLIFY_TOLERANCE,
+    }
+
+
+def hilbert_sorted_run_details(run_details: Optional[dict] = None) -> Optional[dict]:
+    """Add to the run details that the test files are hilbert sorted if they are.
+
+    Results with the test files in their original order don't get the extra detail, so
+    they stay comparable with the results of before they could be sorted.
+
+    Args:
+        run_details (dict, optional): the run details to add the detail to.
+            Defaults to None.
+
+    Returns:
+        Optional[dict]: the run details.
+    """
+    if not testdata.HILBERT_SORTED:
+        return run_details
+
+    return {**(run_details or {}), "hilbert_sorted": True}
@@ -2,85 +2,260 @@
 Module to benchmark geopandas operations.
 """
 
-from datetime import datetime
+import atexit
+import functools
 import logging
-import multiprocessing
+import math
 from pathlib import Path
+import time
+from typing import Optional
 
+import dask
+import dask.dataframe as dd
 import dask_geopandas as dgpd
+import distributed
+from distributed import Client, LocalCluster
 
 import geofileops as gfo
-from geofileops.util import geoseries_util
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 import pyogrio
+import shapely
 
+import benchmarker
 from benchmarker import RunResult
+from benchmarks_vector_ops import _common
 import testdata
 
 logger = logging.getLogger(__name__)
 
 _package = "dask-geopandas"
 _package_version = dgpd.__version__.replace("v", "")
-_nb_parallel = 12
+_nb_parallel = benchmarker.cap_nb_parallel(12)
 
-nb_cores = multiprocessing.cpu_count()
-if nb_cores < _nb_parallel:
-    logger.warning(
-        f"nb_parallel specified ({_nb_parallel}) > nb logical cores available "
-        f"({nb_cores})"
-    )
+
+# Fuse trivial, consecutive layers (e.g. buffer + explode) into one task per partition
+dask.config.set({"optimization.fuse.active": True})
+
+
+_client: Optional[Client] = None
+
+
+def _get_client() -> Client:
+    """Get the distributed client shared by all benchmarks in this module.
+
+    The cluster is only started the first time, so the startup time isn't paid for
+    every benchmark. It has one in-process worker with a thread per core: shapely
+    releases the GIL, so the threads run in parallel while sharing the geometries
+    instead of pickling them between worker processes.
+
+    Returns:
+        Client: the client.
+    """
+    global _client
+    if _client is None:
+        _client = Client(
+            LocalCluster(
+                n_workers=1,
+                threads_per_worker=_nb_parallel,
+                processes=False,
+                memory_limit=None,
+            )
+        )
+        atexit.register(_client.close)
+
+    return _client
+
+
+def _compute(collection, scheduler: Optional[str] = None):
+    """Optimize the graph of the dask collection and compute it.
+
+    Optimizing the graph fuses its layers, so the scheduler has less, but bigger tasks
+    to schedule. The threaded scheduler is used, unless a distributed client is
+    active.
+
+    Args:
+        collection: the dask collection to compute.
+        scheduler (str, optional): the scheduler to use, e.g. "threads" to not use the
+            distributed client even if it is active. Defaults to None.
+
+    Returns:
+        the computed result.
+    """
+    return collection.compute(optimize_graph=True, scheduler=scheduler)
+
+
+def _write_result(
+    dgdf: dgpd.GeoDataFrame, path: Path, scheduler: Optional[str] = None
+) -> Path:
+    """Compute the partitions of the dask GeoDataFrame and write them to a file.
+
+    For GPKG, the partitions are computed in parallel on the distributed client and
+    appended to the file as soon as they are ready, so the full result never needs to
+    be in memory at once. The spatial index is created once all partitions have been
+    written. The other output formats don't support appending, so the full result is
+    computed and written with `_common.write_result`. This is also the case if another
+    scheduler is asked for.
+
+    Args:
+        dgdf (dgpd.GeoDataFrame): the data to compute and write.
+        path (Path): the file to write to. The suffix is replaced by the one of
+            `_common.OUTPUT_FORMAT`.
+        scheduler (str, optional): the scheduler to compute the data with instead of
+            the distributed client, e.g. "threads". Defaults to None.
+
+    Returns:
+        Path: the file that was written.
+    """
+    if _common.OUTPUT_FORMAT != "GPKG" or scheduler is not None:
+        return _common.write_result(_compute(dgdf, scheduler=scheduler), path)
+
+    # to_delayed optimizes the graph
+    partitions = _get_client().compute(dgdf.to_delayed())
+    write_kwargs = {
+        "layer": path.stem,
+        "driver": "GPKG",
+        "use_arrow": True,
+        "promote_to_multi": True,
+        "layer_options": {"SPATIAL_INDEX": "NO"},
+    }
+    nb_written = 0
+    with _common.gdal_config_options(_common.GPKG_WRITE_CONFIG_OPTIONS):
+        for future, partition_gdf in distributed.as_completed(
+            partitions, with_results=True
+        ):
+            if len(partition_gdf) > 0:
+                pyogrio.write_dataframe(
+                    partition_gdf, path, append=nb_written > 0, **write_kwargs
+                )
+                nb_written += len(partition_gdf)
+            # Release the partition as soon as it is written
+            future.release()
+        if nb_written == 0:
+            # All partitions were empty: still write the (empty) layer
+            pyogrio.write_dataframe(dgdf._meta, path, **write_kwargs)
+        gfo.create_spatial_index(path, layer=path.stem)
+
+    logger.info(f"nb features written: {nb_written}")
+    return path
+
+
+def _batch_to_gdf(
+    batch: pa.RecordBatch, start: int, geometry_name: str, crs: Optional[str]
+) -> gpd.GeoDataFrame:
+    """Convert an arrow record batch as read by pyogrio to a GeoDataFrame.
+
+    Args:
+        batch (pa.RecordBatch): the batch to convert, with the geometries as WKB.
+        start (int): the index of the first row of the batch in the file, so the
+            index is unique over all batches.
+        geometry_name (str): the name of the geometry column in the batch.
+        crs (str, optional): the crs of the geometries.
+
+    Returns:
+        gpd.GeoDataFrame: the GeoDataFrame.
+    """
+    geometry_index = batch.schema.get_field_index(geometry_name)
+    attribute_indexes = [i for i in range(batch.num_columns) if i != geometry_index]
+    df = batch.select(attribute_indexes).to_pandas()
+    df.index = pd.RangeIndex(start, start + batch.num_rows)
+    wkb = batch.column(geometry_index).to_numpy(zero_copy_only=False)
+
+    return gpd.GeoDataFrame(df, geometry=shapely.from_wkb(wkb), crs=crs)
+
+
+@functools.lru_cache(maxsize=2)
+def _get_persisted_dgdf(
+    path: Path, columns: Optional[tuple[str, ...]] = None
+) -> tuple[dgpd.GeoDataFrame, float, float]:
+    """Read the file and partition it in a persisted dask GeoDataFrame.
+
+    The file is streamed in arrow batches, one per partition, that are converted to
+    partitions directly. This avoids first building one big GeoDataFrame that is split
+    up again afterwards, and the WKB geometries are decoded in parallel.
+
+    The result is cached, so the benchmarks on the same input share the partitioned
+    data instead of partitioning it again each time. Dask collections are immutable,
+    so sharing them is safe. Reading and partitioning the input is part of the
+    benchmarks though, so the seconds they took are returned, also if the cached
+    result is used.
+
+    Args:
+        path (Path): the file to read.
+        columns (tuple[str, ...], optional): the attribute columns to read. If None,
+            all columns are read. Use () to only read the geometry. Defaults to None.
+
+    Returns:
+        tuple[dgpd.GeoDataFrame, float, float]: the dask GeoDataFrame + the seconds
+            the read took + the seconds the partitioning took.
+    """
+    start_time = time.perf_counter()
+    nb_features = pyogrio.read_info(path)["features"]
+    with pyogrio.open_arrow(
+        path,
+        columns=list(columns) if columns is not None else None,
+        batch_size=max(math.ceil(nb_features / _nb_parallel), 1),
+        use_pyarrow=True,
+    ) as (meta, reader):
+        batches = list(reader)
+    secs_read = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    geometry_name = meta["geometry_name"] or "wkb_geometry"
+    starts = np.cumsum([0] + [batch.num_rows for batch in batches]).tolist()
+    partitions = [
+        dask.delayed(_batch_to_gdf)(batch, start, geometry_name, meta["crs"])
+        for batch, start in zip(batches, starts)
+    ]
+    dgdf = dd.from_delayed(
+        partitions,
+        meta=_batch_to_gdf(batches[0].slice(0, 0), 0, geometry_name, meta["crs"]),
+        divisions=starts[:-1] + [starts[-1] - 1],
+    ).persist()
+    # With a distributed client, persist returns before the partitions are computed
+    distributed.wait(dgdf)
+    assert isinstance(dgdf, dgpd.GeoDataFrame)
+    secs_partition = time.perf_counter() - start_time
+
+    return dgdf, secs_read, secs_partition
 
 
 def buffer(tmp_dir: Path) -> RunResult:
     # Init
+    _get_client()
     input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
 
     # Go!
-    # Read input file
-    start_time = datetime.now()
-    gdf = pyogrio.read_dataframe(input_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    # Read + partition input file
+    dgdf, secs_read, secs_partition = _get_persisted_dgdf(input_path, columns=())
+    logger.info(f"time for read: {secs_read}, partitioning: {secs_partition}")
+    start_time = time.perf_counter()
 
     # Buffer
-    start_time_buffer = datetime.now()
-    dgdf = dgpd.from_geopandas(gdf, npartitions=_nb_parallel)
-    assert isinstance(dgdf.geometry, dgpd.GeoSeries)
-    dgdf.geometry = dgdf.geometry.buffer(distance=1, resolution=5).compute()
-    assert isinstance(dgdf, dgpd.GeoDataFrame)
-    logger.info(
-        f"time for buffer: {(datetime.now()-start_time_buffer).total_seconds()}"
-    )
-
-    # Write to output file
-    start_time_write = datetime.now()
-
-    # Remark: write to parquet is significantly faster (~4x), but isn't really
-    # a typical geo file + actually is 1 file per partition in a directory...?
-    # output_path = tmp_dir / f"{input_path.stem}_geopandas_buf.parquet"
-    # dask_gdf.to_parquet(output_path)
+    buffered_dgdf = dgdf.set_geometry(dgdf.geometry.buffer(distance=1, resolution=5))
 
-    # Convert to normal GeoDataFrame
-    result_gdf = dgdf.compute()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    # Remark: the harmonization would ideally also be done in parallel
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    # Compute + write to output file
+    start_time_write = time.perf_counter()
 
     output_path = tmp_dir / f"{input_path.stem}_{_package}_buf.gpkg"
-    pyogrio.write_dataframe(
-        result_gdf, output_path, layer=output_path.stem, driver="GPKG"
-    )
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    output_path = _write_result(buffered_dgdf, output_path)
+    logger.info(f"compute + write took {time.perf_counter() - start_time_write}")
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="buffer",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + secs_partition + time.perf_counter() - start_time,
         operation_descr="buffer agri parcels BEFL (~500k polygons)",
-        run_details={"nb_cpu": _nb_parallel},
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details({"nb_cpu": _nb_parallel})
+        ),
     )
 
     # Cleanup
     # shutil.rmtree(output_path)
-    output_path.unlink()
+    _common.remove_output(output_path)
 
     return result
 
@@ -95,50 +270,38 @@ def _clip(tmp_dir: Path) -> RunResult:
     # TODO: try using a less complex clip layer
 
     # Init
+    _get_client()
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
-    """
-    client = Client(
-        LocalCluster(
-            n_workers=_nb_parallel,
-            threads_per_worker=1,
-            memory_limit="1GB",
-        )
-    )
-    """
 
     # Go!
     # Read input files
-    start_time = datetime.now()
-    input1_gdf = pyogrio.read_dataframe(input1_path)
-    input2_gdf = pyogrio.read_dataframe(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # Apply operation
-    start_time_op = datetime.now()
     input1_dgdf = dgpd.from_geopandas(input1_gdf, npartitions=_nb_parallel)
     result_dgdf = dgpd.clip(input1_dgdf, input2_gdf, keep_geom_type=True)
-    result_gdf = result_dgdf.compute()
-    logger.info(f"time for operation: {(datetime.now()-start_time_op).total_seconds()}")
 
-    # Write to output file
-    start_time_write = datetime.now()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    # result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    # Compute + write to output file
+    start_time_write = time.perf_counter()
     output_path = (
         tmp_dir / f"{input1_path.stem}_clip_{input2_path.stem}_{_package}.gpkg"
     )
-    pyogrio.write_dataframe(
-        result_gdf, output_path, layer=output_path.stem, driver="GPKG"
-    )
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
-    secs_taken = (datetime.now() - start_time).total_seconds()
+    output_path = _write_result(result_dgdf, output_path)
+    logger.info(f"compute + write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="clip",
         secs_taken=secs_taken,
         operation_descr="clip of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
@@ -148,197 +311,220 @@ def _clip(tmp_dir: Path) -> RunResult:
 
 def dissolve(tmp_dir: Path) -> RunResult:
     # Init
+    _get_client()
     input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
 
     # Go!
-    # Read input file
-    start_time = datetime.now()
-    gdf = pyogrio.read_dataframe(input_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    # Read + partition input file
+    dgdf, secs_read, secs_partition = _get_persisted_dgdf(input_path, columns=())
+    logger.info(f"time for read: {secs_read}, partitioning: {secs_partition}")
+    start_time = time.perf_counter()
 
     # dissolve
-    start_time_dissolve = datetime.now()
-    dgdf = dgpd.from_geopandas(gdf, npartitions=_nb_parallel)
-    dgdf = dgdf.dissolve(split_out=_nb_parallel)  # type: ignore
-    dgdf = dgdf.explode()
-    result_gdf = dgdf.compute()
-    logger.info(
-        f"time for dissolve: {(datetime.now()-start_time_dissolve).total_seconds()}"
+    start_time_dissolve = time.perf_counter()
+    # Sort the rows spatially so neighbouring geometries end up in the same partition:
+    # the per-partition unions then really reduce the data before the final merge.
+    dgdf = dgdf.spatial_shuffle(by="hilbert", level=16, npartitions=_nb_parallel)
+    # Union the partitions in parallel, so only one geometry per partition remains to
+    # be merged in the final, single threaded union.
+    partition_unions = dgdf.geometry.map_partitions(
+        lambda geoseries: gpd.GeoSeries([geoseries.union_all()], crs=geoseries.crs),
+        meta=gpd.GeoSeries(crs=dgdf.crs),
     )
+    union = _compute(partition_unions).union_all()
+    result_gdf = gpd.GeoDataFrame(geometry=[union], crs=dgdf.crs)
+    result_gdf = result_gdf.explode(ignore_index=True)
+    logger.info(f"time for dissolve: {time.perf_counter() - start_time_dissolve}")
 
     # Write to output file
-    start_time_write = datetime.now()
-
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    # Remark: the harmonization would ideally also be done in parallel
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    start_time_write = time.perf_counter()
 
     output_path = tmp_dir / f"{input_path.stem}_{_package}_diss.gpkg"
-    pyogrio.write_dataframe(
-        result_gdf, output_path, layer=output_path.stem, driver="GPKG"
-    )
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="dissolve",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + secs_partition + time.perf_counter() - start_time,
         operation_descr="dissolve agri parcels BEFL (~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
 def dissolve_groupby(tmp_dir: Path) -> RunResult:
     # Init
+    _get_client()
     input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
 
     # Go!
-    # Read input file
-    start_time = datetime.now()
-    gdf = pyogrio.read_dataframe(input_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    # Read + partition input file
+    dgdf, secs_read, secs_partition = _get_persisted_dgdf(
+        input_path, columns=("GWSGRPH_LB",)
+    )
+    logger.info(f"time for read: {secs_read}, partitioning: {secs_partition}")
+    start_time = time.perf_counter()
 
     # dissolve
-    start_time_dissolve = datetime.now()
-    dgdf = dgpd.from_geopandas(gdf, npartitions=_nb_parallel)
-    assert isinstance(dgdf, dgpd.GeoDataFrame)
-    dgdf = dgdf.dissolve(by="GWSGRPH_LB", split_out=_nb_parallel)
-    dgdf = dgdf.explode()
-    result_gdf = dgdf.compute()
-    logger.info(
-        f"time for dissolve: {(datetime.now()-start_time_dissolve).total_seconds()}"
+    # Shuffle once so all rows of a group end up in the same partition, so every
+    # partition can be dissolved on its own without a shuffle of the union results.
+    # More partitions than groups would only give empty partitions.
+    nb_groups = _compute(dgdf["GWSGRPH_LB"].nunique())
+    dgdf = dgdf.shuffle(on="GWSGRPH_LB", npartitions=min(_nb_parallel, nb_groups))
+    dgdf = dgdf.map_partitions(
+        lambda partition: partition.dissolve(by="GWSGRPH_LB"),
+        meta=dgdf._meta.dissolve(by="GWSGRPH_LB"),
     )
+    dgdf = dgdf.explode()
 
-    # Write to output file
-    start_time_write = datetime.now()
-
-    # Remark: write to parquet is significantly faster (~4x), but isn't really
-    # a typical geo file + actually is 1 file per partition in a directory...?
-    # output_path = tmp_dir / f"{input_path.stem}_geopandas_buf.parquet"
-    # dask_gdf.to_parquet(output_path)
-
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    # Remark: the harmonization would ideally also be done in parallel
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    # Compute + write to output file
+    start_time_write = time.perf_counter()
 
     output_path = tmp_dir / f"{input_path.stem}_{_package}_diss_groupby.gpkg"
-    pyogrio.write_dataframe(
-        result_gdf, output_path, layer=output_path.stem, driver="GPKG"
-    )
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    output_path = _write_result(dgdf, output_path)
+    logger.info(f"compute + write took {time.perf_counter() - start_time_write}")
 
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="dissolve_groupby",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + secs_partition + time.perf_counter() - start_time,
         operation_descr=(
             "dissolve on agri parcels BEFL (~500k polygons), groupby=GWSGRPH_LB"
         ),
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
 def join_by_location_intersects(tmp_dir: Path) -> RunResult:
     # Init-
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
 
     ### Go! ###
     # Read input files
-    start_time = datetime.now()
-    input1_gdf = pyogrio.read_dataframe(input1_path)
-    input2_gdf = pyogrio.read_dataframe(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # intersect
-    start_time_operation = datetime.now()
-    input1_dgdf = dgpd.from_geopandas(input1_gdf, npartitions=_nb_parallel)
-    joined_dgdf = dgpd.sjoin(input1_dgdf, input2_gdf, predicate="intersects")
-    result_gdf = joined_dgdf.compute()
-    logger.info(
-        f"time for intersect: {(datetime.now()-start_time_operation).total_seconds()}"
-    )
+    # Use the threaded scheduler instead of the distributed client: the client would
+    # serialize input2 with the graph, losing its spatial index.
+    with dask.config.set(scheduler="threads"):
+        input1_dgdf = dgpd.from_geopandas(input1_gdf, npartitions=_nb_parallel)
+        # Sort the rows spatially, so the queries of a partition hit the same part of
+        # the spatial index.
+        input1_dgdf = input1_dgdf.spatial_shuffle(
+            by="hilbert", level=16, npartitions=_nb_parallel
+        )
+        # Build the spatial index (a shapely STRtree) on input2 once upfront: the
+        # threads share it, so it isn't sent to/rebuilt for every partition like in
+        # dgpd.sjoin.
+        _ = input2_gdf.sindex
+        joined_dgdf = input1_dgdf.map_partitions(
+            lambda partition: partition.sjoin(input2_gdf, predicate="intersects"),
+            meta=input1_dgdf._meta.sjoin(input2_gdf.iloc[:0], predicate="intersects"),
+        )
 
-    # Write to output file
-    start_time_write = datetime.now()
-    output_path = (
-        tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}_{_package}.gpkg"
-    )
-    pyogrio.write_dataframe(
-        result_gdf, output_path, layer=output_path.stem, driver="GPKG"
-    )
+        # Compute + write to output file
+        start_time_write = time.perf_counter()
+        output_path = (
+            tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}_{_package}.gpkg"
+        )
+        output_path = _write_result(joined_dgdf, output_path, scheduler="threads")
 
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    logger.info(f"compute + write took {time.perf_counter() - start_time_write}")
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="join_by_location_intersects",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + time.perf_counter() - start_time,
         operation_descr=(
             "join_by_location_intersects between 2 agri parcel layers BEFL "
             "(2*~500.000 polygons)"
         ),
-        run_details={"nb_cpu": multiprocessing.cpu_count()},
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details({"nb_cpu": _nb_parallel})
+        ),
     )
 
     # Cleanup and return
-    logger.info(f"nb features in result: {gfo.get_layerinfo(output_path).featurecount}")
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
-"""
 def intersection(tmp_dir: Path) -> RunResult:
-    # Intersection operation is not yet supported in dask-geopandas
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
 
     # Go!
     # Read input files
-    start_time = datetime.now()
-    input1_gdf = pyogrio.read_dataframe(input1_path)
-    input2_gdf = pyogrio.read_dataframe(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # intersection
-    start_time_op = datetime.now()
-    input1_dgdf = dgpd.from_geopandas(
-        input1_gdf, npartitions=nb_parallel
-    )
-    result_gdf = input1_dgdf.overlay(input2_gdf, how="intersection")
-    logger.info(
-        f"time for intersection: {(datetime.now()-start_time_op).total_seconds()}"
-    )
+    # Overlay is not supported in dask-geopandas, so sort input1 spatially and overlay
+    # each partition with only the features of input2 that intersect with it. Every
+    # feature of input1 is in exactly one partition, so the partition results together
+    # are the full intersection.
+    # Use the threaded scheduler instead of the distributed client: the client would
+    # serialize input2 with the graph, losing its spatial index.
+    with dask.config.set(scheduler="threads"):
+        input1_dgdf = dgpd.from_geopandas(input1_gdf, npartitions=_nb_parallel)
+        input1_dgdf = input1_dgdf.spatial_shuffle(
+            by="hilbert", level=16, npartitions=_nb_parallel
+        )
+        # Build the spatial index on input2 once upfront, the threads share it.
+        _ = input2_gdf.sindex
+
+        def intersection_partition(partition: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+            _, input2_idx = input2_gdf.sindex.query(
+                partition.geometry, predicate="intersects"
+            )
+            input2_partition = input2_gdf.iloc[np.unique(input2_idx)]
+            return partition.overlay(input2_partition, how="intersection")
+
+        result_dgdf = input1_dgdf.map_partitions(
+            intersection_partition,
+            meta=intersection_partition(input1_gdf.iloc[:1]).iloc[:0],
+        )
 
-    # Write to output file
-    start_time_write = datetime.now()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
-    output_path = (
-        tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}_{_package}.gpkg"
-    )
-    pyogrio.write_dataframe(
-        result_gdf, output_path, layer=output_path.stem, driver="GPKG"
-    )
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
-    secs_taken = (datetime.now() - start_time).total_seconds()
+        # Compute + write to output file
+        start_time_write = time.perf_counter()
+        output_path = (
+            tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}_{_package}.gpkg"
+        )
+        output_path = _write_result(result_dgdf, output_path, scheduler="threads")
+
+    logger.info(f"compute + write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="intersection",
         secs_taken=secs_taken,
         operation_descr="intersection of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details({"nb_cpu": _nb_parallel})
+        ),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
-"""
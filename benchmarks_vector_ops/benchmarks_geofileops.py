@@ -2,222 +2,245 @@
 Module to benchmark geofileops operations.
 """
 
-from datetime import datetime
-import inspect
+from collections.abc import Callable
 import logging
-import multiprocessing
 from pathlib import Path
+import time
+from typing import Optional
 
 import geofileops as gfo
-import shapely
 
+import benchmarker
 from benchmarker import RunResult
+from benchmarks_vector_ops import _common
 import testdata
 
 logger = logging.getLogger(__name__)
 
 _package = "geofileops"
 _package_version = gfo.__version__
-_nb_parallel = 12
-
-nb_cores = multiprocessing.cpu_count()
-if nb_cores < _nb_parallel:
-    logger.warning(
-        f"nb_parallel specified ({_nb_parallel}) > nb logical cores available "
-        f"({nb_cores})"
+_nb_parallel = benchmarker.cap_nb_parallel(12)
+
+
+def _run_benchmark(
+    operation: str,
+    operation_descr: str,
+    output_path: Path,
+    run_operation: Callable[[], object],
+    run_details: Optional[dict] = None,
+) -> RunResult:
+    """Run and time a geofileops operation that writes to `output_path`.
+
+    The operation runs with the GDAL config options to read and write GPKG files fast.
+    The output file is removed in the background afterwards, also if the operation
+    fails.
+
+    Args:
+        operation (str): the name of the operation benchmarked.
+        operation_descr (str): the description of the operation benchmarked.
+        output_path (Path): the output file the operation writes to.
+        run_operation (Callable[[], object]): function that runs the operation.
+        run_details (dict, optional): the run details of the benchmark. The versions
+            of the underlying libraries are added to them. Defaults to None.
+
+    Returns:
+        RunResult: the result of the benchmark.
+    """
+    try:
+        start_time = time.perf_counter()
+        with _common.gdal_config_env(
+            {**_common.GPKG_WRITE_CONFIG_OPTIONS, **_common.GPKG_READ_CONFIG_OPTIONS}
+        ):
+            run_operation()
+        secs_taken = time.perf_counter() - start_time
+
+        logger.info(
+            f"nb features in result: {gfo.get_layerinfo(output_path).featurecount}"
+        )
+    finally:
+        # Cleanup
+        _common.remove_output(output_path)
+
+    return RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation=operation,
+        secs_taken=secs_taken,
+        operation_descr=operation_descr,
+        run_details={
+            **(_common.hilbert_sorted_run_details(run_details) or {}),
+            **_common.LIB_VERSIONS,
+        },
     )
 
 
-def buffer(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def buffer(tmp_dir: Path, nb_parallel: int = _nb_parallel) -> RunResult:
     # Init
     input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input_path.stem}_buf.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input_path.stem}_buf.gpkg"
-    gfo.buffer(
-        input_path, output_path, distance=1, force=True, nb_parallel=_nb_parallel
-    )
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    return _run_benchmark(
         operation="buffer",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr="buffer on agri parcel layer BEFL (~500k polygons)",
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.buffer(
+            input_path,
+            output_path,
+            distance=1,
+            columns=[],
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
 
-    # Cleanup and return
-    output_path.unlink()
-    return result
-
 
-def _clip(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def _clip(tmp_dir: Path, nb_parallel: int = _nb_parallel) -> RunResult:
     """
     Clip doesn't work for the other libraries, so no use to activate it here.
     """
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input1_path.stem}_clip_{input2_path.stem}.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input1_path.stem}_clip_{input2_path.stem}.gpkg"
-    gfo.clip(
-        input_path=input1_path,
-        clip_path=input2_path,
-        output_path=output_path,
-        force=True,
-        nb_parallel=_nb_parallel,
-    )
-    result = RunResult(
-        package="geofileops",
-        package_version=gfo.__version__,
+    return _run_benchmark(
         operation="clip",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr="clip of 2 agri parcel layers BEFL (2*~500k polygons)",
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.clip(
+            input_path=input1_path,
+            clip_path=input2_path,
+            output_path=output_path,
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
 
-    # Cleanup and return
-    output_path.unlink()
-    return result
-
 
-def dissolve_nogroupby(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def dissolve_nogroupby(tmp_dir: Path, nb_parallel: int = _nb_parallel) -> RunResult:
     # Init
     input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input_path.stem}_diss_nogroupby.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input_path.stem}_diss_nogroupby.gpkg"
-    gfo.dissolve(
-        input_path=input_path,
-        output_path=output_path,
-        explodecollections=True,
-        force=True,
-        nb_parallel=_nb_parallel,
-    )
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    return _run_benchmark(
         operation="dissolve",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr="dissolve on agri parcels BEFL (~500k polygons)",
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.dissolve(
+            input_path=input_path,
+            output_path=output_path,
+            explodecollections=True,
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
 
-    # Cleanup and return
-    output_path.unlink()
-    return result
-
 
-def dissolve_groupby(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def dissolve_groupby(tmp_dir: Path, nb_parallel: int = _nb_parallel) -> RunResult:
     # Init
     input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input_path.stem}_diss_groupby.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input_path.stem}_diss_groupby.gpkg"
-    gfo.dissolve(
-        input_path,
-        output_path,
-        groupby_columns=["GWSGRPH_LB"],
-        explodecollections=True,
-        force=True,
-        nb_parallel=_nb_parallel,
-    )
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    return _run_benchmark(
         operation="dissolve_groupby",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr=(
             "dissolve on agri parcels BEFL (~500k polygons), groupby=[GWSGRPH_LB]"
         ),
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.dissolve(
+            input_path,
+            output_path,
+            groupby_columns=["GWSGRPH_LB"],
+            explodecollections=True,
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
 
-    # Cleanup and return
-    output_path.unlink()
-    return result
 
-
-def intersection(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def intersection(tmp_dir: Path, nb_parallel: int = _nb_parallel) -> RunResult:
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}.gpkg"
-    gfo.intersection(
-        input1_path=input1_path,
-        input2_path=input2_path,
-        output_path=output_path,
-        force=True,
-        nb_parallel=_nb_parallel,
-    )
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    return _run_benchmark(
         operation="intersection",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr="intersection of 2 agri parcel layers BEFL (2*~500k polygons)",
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.intersection(
+            input1_path=input1_path,
+            input2_path=input2_path,
+            output_path=output_path,
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
 
-    # Cleanup and return
-    output_path.unlink()
-    return result
 
-
-def _join_by_location_intersects(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def _join_by_location_intersects(
+    tmp_dir: Path, nb_parallel: int = _nb_parallel
+) -> RunResult:
     # Init
-    function_name = inspect.currentframe().f_code.co_name  # type: ignore[union-attr]
+    function_name = "_join_by_location_intersects"
 
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
-
-    # Go!
-    start_time = datetime.now()
     output_path = (
         tmp_dir / f"{input1_path.stem}_join_inters_{input2_path.stem}_{_package}.gpkg"
     )
-    gfo.join_by_location(
-        input1_path=input1_path,
-        input2_path=input2_path,
-        output_path=output_path,
-        spatial_relations_query="intersects is True",
-        force=True,
-        nb_parallel=_nb_parallel,
-    )
 
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    # Go!
+    return _run_benchmark(
         operation=function_name,
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr=(
             "join_by_location_intersects between 2 agri parcel layers BEFL "
             "(2*~500.000 polygons)"
         ),
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.join_by_location(
+            input1_path=input1_path,
+            input2_path=input2_path,
+            output_path=output_path,
+            spatial_relations_query="intersects is True",
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
 
-    # Cleanup and return
-    logger.info(f"nb features in result: {gfo.get_layerinfo(output_path).featurecount}")
-    output_path.unlink()
-    return result
-
 
-def symdif_complexpolys_agri(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def symdif_complexpolys_agri(
+    tmp_dir: Path, nb_parallel: int = _nb_parallel
+) -> RunResult:
     # Init
-    function_name = inspect.currentframe().f_code.co_name  # type: ignore[union-attr]
+    function_name = "symdif_complexpolys_agri"
 
     input1_path, input1_descr = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     info1 = gfo.get_layerinfo(input1_path)
-    bbox = shapely.box(*info1.total_bounds).buffer(-10_000, join_style="mitre").bounds
+    # Inset the bounds of input1 with 10 km
+    minx, miny, maxx, maxy = info1.total_bounds
+    bbox = (minx + 10_000, miny + 10_000, maxx - 10_000, maxy - 10_000)
     crs = info1.crs
     input2_path, input2_descr = testdata.create_testfile(
         bbox=bbox,
@@ -228,56 +251,45 @@ def symdif_complexpolys_agri(tmp_dir: Path) -> RunResult:
         poly_height=15_000,
         crs=crs,
         dst_dir=tmp_dir,
+        simplify_tolerance=_common.COMPLEXPOLYS_SIMPLIFY_TOLERANCE,
     )
+    output_path = tmp_dir / f"{input1_path.stem}_symdif_{input2_path.stem}.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input1_path.stem}_symdif_{input2_path.stem}.gpkg"
-    gfo.symmetric_difference(
-        input1_path=input1_path,
-        input2_path=input2_path,
-        output_path=output_path,
-        nb_parallel=_nb_parallel,
-        force=True,
-    )
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    return _run_benchmark(
         operation=function_name,
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr=f"{function_name} between {input1_descr} and {input2_descr}",
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.symmetric_difference(
+            input1_path=input1_path,
+            input2_path=input2_path,
+            output_path=output_path,
+            nb_parallel=nb_parallel,
+            force=True,
+        ),
+        run_details=_common.complexpolys_run_details({"nb_cpu": nb_parallel}),
     )
 
-    # Cleanup and return
-    output_path.unlink()
-    return result
-
 
-def union(tmp_dir: Path) -> RunResult:
+@_common.sweep_nb_parallel
+def union(tmp_dir: Path, nb_parallel: int = _nb_parallel) -> RunResult:
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}.gpkg"
 
     # Go!
-    start_time = datetime.now()
-    output_path = tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}.gpkg"
-    gfo.union(
-        input1_path=input1_path,
-        input2_path=input2_path,
-        output_path=output_path,
-        force=True,
-        nb_parallel=_nb_parallel,
-    )
-    result = RunResult(
-        package=_package,
-        package_version=_package_version,
+    return _run_benchmark(
         operation="union",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
         operation_descr="union of 2 agri parcel layers BEFL (2*~500k polygons)",
-        run_details={"nb_cpu": _nb_parallel},
+        output_path=output_path,
+        run_operation=lambda: gfo.union(
+            input1_path=input1_path,
+            input2_path=input2_path,
+            output_path=output_path,
+            force=True,
+            nb_parallel=nb_parallel,
+        ),
+        run_details={"nb_cpu": nb_parallel},
     )
-
-    # Cleanup and return
-    output_path.unlink()
-    return result
@@ -2,17 +2,15 @@
 Module to benchmark geopandas operations.
 """
 
-from datetime import datetime
-import inspect
 import logging
 from pathlib import Path
+import time
 
-from geofileops.util import _geoseries_util as geoseries_util
 import geofileops as gfo
 import geopandas as gpd
-import shapely
 
 from benchmarker import RunResult
+from benchmarks_vector_ops import _common
 import testdata
 
 logger = logging.getLogger(__name__)
@@ -27,32 +25,31 @@ def buffer(tmp_dir: Path) -> RunResult:
 
     # Go!
     # Read input file
-    start_time = datetime.now()
-    gdf = gpd.read_file(input_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    gdf, secs_read = _common.read_dataframe(input_path, columns=[])
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # Buffer
-    start_time_buffer = datetime.now()
+    start_time_buffer = time.perf_counter()
     gdf.geometry = gdf.geometry.buffer(distance=1, resolution=5)
-    logger.info(
-        f"time for buffer: {(datetime.now()-start_time_buffer).total_seconds()}"
-    )
+    logger.info(f"time for buffer: {time.perf_counter() - start_time_buffer}")
 
     # Write to output file
-    start_time_write = datetime.now()
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input_path.stem}_geopandas_buf.gpkg"
-    gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    output_path = _common.write_result(gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="buffer",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + time.perf_counter() - start_time,
         operation_descr="buffer agri parcels BEFL (~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
@@ -62,40 +59,42 @@ def _clip(tmp_dir: Path) -> RunResult:
     so no use to activate benchmark
     """
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
 
     # Go!
     # Read input files
-    start_time = datetime.now()
-    input1_gdf = gpd.read_file(input1_path)
-    input2_gdf = gpd.read_file(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # clip
-    start_time_op = datetime.now()
+    start_time_op = time.perf_counter()
     result_gdf = gpd.clip(input1_gdf, input2_gdf, keep_geom_type=True)
-    logger.info(f"time for clip: {(datetime.now()-start_time_op).total_seconds()}")
+    # Free the inputs before writing, to limit the peak memory usage
+    del input1_gdf, input2_gdf
+    logger.info(f"time for clip: {time.perf_counter() - start_time_op}")
 
     # Write to output file
-    start_time_write = datetime.now()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    assert isinstance(result_gdf.geometry, gpd.GeoSeries)
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input1_path.stem}_clip_{input2_path.stem}.gpkg"
-    result_gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
-    secs_taken = (datetime.now() - start_time).total_seconds()
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="clip",
         secs_taken=secs_taken,
         operation_descr="clip of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
@@ -105,34 +104,33 @@ def dissolve(tmp_dir: Path) -> RunResult:
 
     # Go!
     # Read input file
-    start_time = datetime.now()
-    gdf = gpd.read_file(input_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    gdf, secs_read = _common.read_dataframe(input_path, columns=[])
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # dissolve
-    start_time_dissolve = datetime.now()
+    start_time_dissolve = time.perf_counter()
     result_gdf = gdf.dissolve()
     assert isinstance(result_gdf, gpd.GeoDataFrame)
     result_gdf = result_gdf.explode(ignore_index=True)
-    logger.info(
-        f"time for dissolve: {(datetime.now()-start_time_dissolve).total_seconds()}"
-    )
+    logger.info(f"time for dissolve: {time.perf_counter() - start_time_dissolve}")
 
     # Write to output file
-    start_time_write = datetime.now()
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input_path.stem}_geopandas_diss.gpkg"
-    result_gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="dissolve",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + time.perf_counter() - start_time,
         operation_descr="dissolve agri parcels BEFL (~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
@@ -142,86 +140,90 @@ def dissolve_groupby(tmp_dir: Path) -> RunResult:
 
     # Go!
     # Read input file
-    start_time = datetime.now()
-    gdf = gpd.read_file(input_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    gdf, secs_read = _common.read_dataframe(input_path)
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # dissolve
-    start_time_dissolve = datetime.now()
-    result_gdf = gdf.dissolve(by="GWSGRPH_LB")
+    start_time_dissolve = time.perf_counter()
+    # Grouping on the category codes is a lot faster than on the strings
+    gdf["GWSGRPH_LB"] = gdf["GWSGRPH_LB"].astype("category")
+    result_gdf = gdf.dissolve(by="GWSGRPH_LB", observed=True)
     assert isinstance(result_gdf, gpd.GeoDataFrame)
     result_gdf = result_gdf.explode(ignore_index=True)
-    logger.info(
-        f"time for dissolve: {(datetime.now()-start_time_dissolve).total_seconds()}"
-    )
+    logger.info(f"time for dissolve: {time.perf_counter() - start_time_dissolve}")
 
     # Write to output file
-    start_time_write = datetime.now()
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input_path.stem}_geopandas_diss_groupby.gpkg"
-    result_gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="dissolve_groupby",
-        secs_taken=(datetime.now() - start_time).total_seconds(),
+        secs_taken=secs_read + time.perf_counter() - start_time,
         operation_descr=(
             "dissolve on agri parcels BEFL (~500k polygons), groupby=GWSGRPH_LB"
         ),
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
 def intersection(tmp_dir: Path) -> RunResult:
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
 
     # Go!
     # Read input files
-    start_time = datetime.now()
-    input1_gdf = gpd.read_file(input1_path)
-    input2_gdf = gpd.read_file(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # intersection
-    start_time_op = datetime.now()
+    start_time_op = time.perf_counter()
     result_gdf = input1_gdf.overlay(input2_gdf, how="intersection")
-    logger.info(
-        f"time for intersection: {(datetime.now()-start_time_op).total_seconds()}"
-    )
+    # Free the inputs before writing, to limit the peak memory usage
+    del input1_gdf, input2_gdf
+    logger.info(f"time for intersection: {time.perf_counter() - start_time_op}")
 
     # Write to output file
-    start_time_write = datetime.now()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}.gpkg"
-    result_gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
-    secs_taken = (datetime.now() - start_time).total_seconds()
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="intersection",
         secs_taken=secs_taken,
         operation_descr="intersection of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
 def symdif_complexpolys_agri(tmp_dir: Path) -> RunResult:
     # Init
-    function_name = inspect.currentframe().f_code.co_name  # type: ignore[union-attr]
+    function_name = "symdif_complexpolys_agri"
 
     input1_path, input1_descr = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     info1 = gfo.get_layerinfo(input1_path)
-    bbox = shapely.box(*info1.total_bounds).buffer(-10_000, join_style="mitre").bounds
+    # Inset the bounds of input1 with 10 km
+    minx, miny, maxx, maxy = info1.total_bounds
+    bbox = (minx + 10_000, miny + 10_000, maxx - 10_000, maxy - 10_000)
     crs = info1.crs
     input2_path, input2_descr = testdata.create_testfile(
         bbox=bbox,
@@ -232,75 +234,80 @@ def symdif_complexpolys_agri(tmp_dir: Path) -> RunResult:
         poly_height=15_000,
         crs=crs,
         dst_dir=tmp_dir,
+        simplify_tolerance=_common.COMPLEXPOLYS_SIMPLIFY_TOLERANCE,
     )
 
-    start_time = datetime.now()
-    input1_gdf = gpd.read_file(input1_path)
-    input2_gdf = gpd.read_file(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # symmetric_difference
-    start_time_op = datetime.now()
+    start_time_op = time.perf_counter()
     result_gdf = input1_gdf.overlay(input2_gdf, how="symmetric_difference")
-    logger.info(
-        "time for symmetric_difference: "
-        f"{(datetime.now()-start_time_op).total_seconds()}"
-    )
+    # Free the inputs before writing, to limit the peak memory usage
+    del input1_gdf, input2_gdf
+    logger.info(f"time for symmetric_difference: {time.perf_counter() - start_time_op}")
 
     # Write to output file
-    start_time_write = datetime.now()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input1_path.stem}_symdif_{input2_path.stem}.gpkg"
-    result_gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
-    secs_taken = (datetime.now() - start_time).total_seconds()
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation=function_name,
         secs_taken=secs_taken,
         operation_descr=f"{function_name} between {input1_descr} and {input2_descr}",
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details(_common.complexpolys_run_details())
+        ),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
 
 
 def union(tmp_dir: Path) -> RunResult:
     # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
     input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
 
     # Go!
     # Read input files
-    start_time = datetime.now()
-    input1_gdf = gpd.read_file(input1_path)
-    input2_gdf = gpd.read_file(input2_path)
-    logger.info(f"time for read: {(datetime.now()-start_time).total_seconds()}")
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
 
     # union
-    start_time_union = datetime.now()
+    start_time_union = time.perf_counter()
     result_gdf = input1_gdf.overlay(input2_gdf, how="union")
-    logger.info(f"time for union: {(datetime.now()-start_time_union).total_seconds()}")
+    # Free the inputs before writing, to limit the peak memory usage
+    del input1_gdf, input2_gdf
+    logger.info(f"time for union: {time.perf_counter() - start_time_union}")
 
     # Write to output file
-    start_time_write = datetime.now()
-    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
-    result_gdf.geometry = geoseries_util.harmonize_geometrytypes(result_gdf.geometry)
+    start_time_write = time.perf_counter()
     output_path = tmp_dir / f"{input1_path.stem}_union_{input2_path.stem}.gpkg"
-    result_gdf.to_file(output_path, layer=output_path.stem, driver="GPKG")
-    logger.info(f"write took {(datetime.now()-start_time_write).total_seconds()}")
-    secs_taken = (datetime.now() - start_time).total_seconds()
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
     result = RunResult(
         package=_package,
         package_version=_package_version,
         operation="union",
         secs_taken=secs_taken,
         operation_descr="union of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
     )
 
     # Cleanup and return
-    output_path.unlink()
+    _common.remove_output(output_path)
     return result
@@ -0,0 +1,510 @@
+"""
+Module to benchmark shapely operations, using pyogrio for IO.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from pathlib import Path
+import time
+
+import geofileops as gfo
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyogrio
+import shapely
+
+import benchmarker
+from benchmarker import RunResult
+from benchmarks_vector_ops import _common
+import testdata
+
+logger = logging.getLogger(__name__)
+
+_package = "shapely"
+_package_version = shapely.__version__
+_nb_parallel = benchmarker.cap_nb_parallel(12)
+
+
+def _buffer_wkb(wkb: np.ndarray) -> np.ndarray:
+    """Buffer the WKB geometries and return the result as WKB.
+
+    shapely releases the GIL in its vectorized functions, so this can run in threads.
+
+    Args:
+        wkb (np.ndarray): the WKB geometries to buffer.
+
+    Returns:
+        np.ndarray: the buffered geometries as WKB.
+    """
+    geoms = shapely.buffer(shapely.from_wkb(wkb), 1, quad_segs=5)
+    # Harmonize, otherwise invalid gpkg because mixed poly and multipoly
+    geoms = _common.force_multipolygon(geoms)
+
+    return shapely.to_wkb(geoms)
+
+
+def _query_intersects(
+    geoms1: np.ndarray, geoms2: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Determine the pairs of geometries that intersect.
+
+    One STRtree is built on `geoms2` and queried with all `geoms1` at once, so the
+    candidate pairs are determined and filtered in one vectorized call. To evaluate
+    the predicate, the `geoms1` are prepared, so pass the most complex geometries as
+    `geoms1` to reuse their preparation over the most candidates.
+
+    Args:
+        geoms1 (np.ndarray): the first geometries.
+        geoms2 (np.ndarray): the second geometries.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: the indexes in `geoms1` and the indexes in
+            `geoms2` of the intersecting pairs, sorted on the indexes in `geoms1`.
+    """
+    tree = shapely.STRtree(geoms2)
+    return tree.query(geoms1, predicate="intersects")
+
+
+def _keep_polygons(geoms: np.ndarray) -> np.ndarray:
+    """Only keep the polygon parts of the geometries, like overlay with keep_geom_type.
+
+    Geometries without polygon parts are dropped.
+
+    Args:
+        geoms (np.ndarray): the geometries.
+
+    Returns:
+        np.ndarray: the polygon parts of the geometries, combined as MultiPolygons.
+    """
+    parts, parts_idx = shapely.get_parts(geoms, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    # The parts of a geometry are combined again, so renumber them consecutively
+    _, parts_idx = np.unique(parts_idx[is_polygon], return_inverse=True)
+    return shapely.multipolygons(parts[is_polygon], indices=parts_idx)
+
+
+def _difference(
+    geoms: np.ndarray,
+    others: np.ndarray,
+    idx: np.ndarray,
+    others_idx: np.ndarray,
+    pool: ThreadPoolExecutor,
+) -> np.ndarray:
+    """Subtract from each geometry the union of the other geometries it intersects.
+
+    The (`idx`, `others_idx`) pairs are sorted on `idx`, so the other geometries per
+    geometry are a slice of the sorted array. The unions of the slices are calculated
+    in chunks in the thread pool, as shapely releases the GIL.
+
+    Args:
+        geoms (np.ndarray): the geometries to subtract from.
+        others (np.ndarray): the geometries to subtract.
+        idx (np.ndarray): the indexes in `geoms` of the intersecting pairs.
+        others_idx (np.ndarray): the indexes in `others` of the intersecting pairs.
+        pool (ThreadPoolExecutor): the thread pool to use.
+
+    Returns:
+        np.ndarray: the differences, as MultiPolygons.
+    """
+    order = np.argsort(idx, kind="stable")
+    slices = np.searchsorted(idx[order], np.arange(len(geoms) + 1))
+    others_sorted = others[others_idx[order]]
+
+    def union_slices(bounds: np.ndarray) -> list:
+        return [
+            shapely.union_all(others_sorted[start:end])
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+
+    # Split the slices in a chunk per thread. Consecutive chunks share a bound, so
+    # every slice is in exactly one chunk.
+    chunk_bounds = np.linspace(0, len(geoms), _nb_parallel + 1, dtype=int)
+    chunks = [
+        slices[start : end + 1]
+        for start, end in zip(chunk_bounds[:-1], chunk_bounds[1:])
+    ]
+    unions = np.empty(len(geoms), dtype=object)
+    unions[:] = [union for chunk in pool.map(union_slices, chunks) for union in chunk]
+
+    # Geometries that don't intersect others are subtracted with an empty geometry,
+    # so they are retained as they are.
+    return _keep_polygons(shapely.difference(geoms, unions))
+
+
+def buffer(tmp_dir: Path) -> RunResult:
+    # Init
+    input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    output_path = tmp_dir / f"{input_path.stem}_{_package}_buf.gpkg"
+
+    # Go!
+    # Stream the input file in arrow batches: read, buffer and write each batch so the
+    # full dataset never needs to be in memory. Only the geometry is needed. Each batch
+    # is split over a thread pool, so the buffering runs on all cores.
+    start_time = time.perf_counter()
+    with pyogrio.open_arrow(input_path, columns=[], use_pyarrow=True) as (meta, reader):
+        geometry_name = meta["geometry_name"] or "wkb_geometry"
+        geometry_index = reader.schema.get_field_index(geometry_name)
+        geometry_type = reader.schema.field(geometry_index).type
+
+        def buffer_batches():
+            for batch in reader:
+                wkb = batch.column(geometry_index).to_numpy(zero_copy_only=False)
+                chunks = np.array_split(wkb, _nb_parallel)
+                buffered_wkb = np.concatenate(list(pool.map(_buffer_wkb, chunks)))
+
+                columns = batch.columns
+                columns[geometry_index] = pa.array(buffered_wkb, type=geometry_type)
+                yield pa.RecordBatch.from_arrays(columns, schema=reader.schema)
+
+        with (
+            ThreadPoolExecutor(max_workers=_nb_parallel) as pool,
+            _common.gdal_config_options(_common.GPKG_WRITE_CONFIG_OPTIONS),
+        ):
+            pyogrio.write_arrow(
+                pa.RecordBatchReader.from_batches(reader.schema, buffer_batches()),
+                output_path,
+                layer=output_path.stem,
+                driver="GPKG",
+                geometry_name=geometry_name,
+                geometry_type="MultiPolygon",
+                crs=meta["crs"],
+                layer_options={"SPATIAL_INDEX": "NO"},
+            )
+            gfo.create_spatial_index(output_path, layer=output_path.stem)
+
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation="buffer",
+        secs_taken=time.perf_counter() - start_time,
+        operation_descr="buffer agri parcels BEFL (~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details({"nb_cpu": _nb_parallel}),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
+
+
+def dissolve(tmp_dir: Path) -> RunResult:
+    # Init
+    input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+
+    # Go!
+    # Read input file: only the geometries are needed to dissolve without groupby
+    input_gdf, secs_read = _common.read_dataframe(input_path, columns=[])
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
+
+    # dissolve
+    # Union all geometries directly and explode the result, without the groupby
+    # machinery geopandas uses for dissolve.
+    start_time_op = time.perf_counter()
+    union = shapely.union_all(np.asarray(input_gdf.geometry.array))
+    result_gdf = gpd.GeoDataFrame(geometry=shapely.get_parts(union), crs=input_gdf.crs)
+    logger.info(f"time for dissolve: {time.perf_counter() - start_time_op}")
+
+    # Write to output file
+    start_time_write = time.perf_counter()
+    output_path = tmp_dir / f"{input_path.stem}_{_package}_diss.gpkg"
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation="dissolve",
+        secs_taken=secs_read + time.perf_counter() - start_time,
+        operation_descr="dissolve agri parcels BEFL (~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
+
+
+def dissolve_groupby(tmp_dir: Path) -> RunResult:
+    # Init
+    input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+
+    # Go!
+    # Read input file: only the groupby column is needed
+    input_gdf, secs_read = _common.read_dataframe(input_path, columns=["GWSGRPH_LB"])
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
+
+    # dissolve
+    # Sort the geometries on their group, so each group is a slice of the sorted array.
+    # The unions of the groups are independent and shapely releases the GIL, so they
+    # run in parallel in a thread pool. Rows without group (code -1) are dropped.
+    start_time_op = time.perf_counter()
+    codes, groups = pd.factorize(input_gdf["GWSGRPH_LB"])
+    order = np.argsort(codes, kind="stable")
+    slices = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+    geoms = np.asarray(input_gdf.geometry.array)[order]
+    with ThreadPoolExecutor(max_workers=_nb_parallel) as pool:
+        unions = list(
+            pool.map(
+                shapely.union_all,
+                (geoms[start:end] for start, end in zip(slices[:-1], slices[1:])),
+            )
+        )
+    parts, parts_idx = shapely.get_parts(unions, return_index=True)
+    result_gdf = gpd.GeoDataFrame(
+        {"GWSGRPH_LB": groups[parts_idx]}, geometry=parts, crs=input_gdf.crs
+    )
+    logger.info(f"time for dissolve: {time.perf_counter() - start_time_op}")
+
+    # Write to output file
+    start_time_write = time.perf_counter()
+    output_path = tmp_dir / f"{input_path.stem}_{_package}_diss_groupby.gpkg"
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation="dissolve_groupby",
+        secs_taken=secs_read + time.perf_counter() - start_time,
+        operation_descr=(
+            "dissolve on agri parcels BEFL (~500k polygons), groupby=GWSGRPH_LB"
+        ),
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details({"nb_cpu": _nb_parallel})
+        ),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
+
+
+def dissolve_coverage_union(tmp_dir: Path) -> RunResult:
+    # Init
+    input_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+
+    # Go!
+    # Read input file: only the geometries are needed to dissolve without groupby
+    input_gdf, secs_read = _common.read_dataframe(input_path, columns=[])
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
+
+    # dissolve
+    # Agri parcels don't overlap, but only share edges, so they form a coverage. For a
+    # coverage, the union can be calculated a lot faster than with a general union.
+    # Remark: if the input isn't a valid coverage, the result can be invalid.
+    start_time_op = time.perf_counter()
+    union = shapely.coverage_union_all(np.asarray(input_gdf.geometry.array))
+    result_gdf = gpd.GeoDataFrame(geometry=shapely.get_parts(union), crs=input_gdf.crs)
+    logger.info(f"time for dissolve: {time.perf_counter() - start_time_op}")
+
+    # Write to output file
+    start_time_write = time.perf_counter()
+    output_path = tmp_dir / f"{input_path.stem}_{_package}_diss_coverage.gpkg"
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation="dissolve_coverage_union",
+        secs_taken=secs_read + time.perf_counter() - start_time,
+        operation_descr="dissolve agri parcels BEFL (~500k polygons) as a coverage",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
+
+
+def intersection(tmp_dir: Path) -> RunResult:
+    # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
+    input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
+
+    # Go!
+    # Read input files: only the geometries are needed to benchmark the geometry cost
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path], columns=[]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
+
+    # intersection
+    start_time_op = time.perf_counter()
+    input1_geoms = np.asarray(input1_gdf.geometry.array)
+    input2_geoms = np.asarray(input2_gdf.geometry.array)
+    input1_idx, input2_idx = _query_intersects(input1_geoms, input2_geoms)
+    intersections = shapely.intersection(
+        input1_geoms[input1_idx], input2_geoms[input2_idx]
+    )
+    result_gdf = gpd.GeoDataFrame(
+        geometry=_keep_polygons(intersections), crs=input1_gdf.crs
+    )
+    logger.info(f"time for intersection: {time.perf_counter() - start_time_op}")
+
+    # Write to output file
+    start_time_write = time.perf_counter()
+    output_path = (
+        tmp_dir / f"{input1_path.stem}_inters_{input2_path.stem}_{_package}.gpkg"
+    )
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation="intersection",
+        secs_taken=secs_taken,
+        operation_descr="intersection of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(_common.output_run_details()),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
+
+
+def symdif_complexpolys_agri(tmp_dir: Path) -> RunResult:
+    # Init
+    function_name = "symdif_complexpolys_agri"
+
+    input1_path, input1_descr = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    info1 = gfo.get_layerinfo(input1_path)
+    # Inset the bounds of input1 with 10 km
+    minx, miny, maxx, maxy = info1.total_bounds
+    bbox = (minx + 10_000, miny + 10_000, maxx - 10_000, maxy - 10_000)
+    crs = info1.crs
+    input2_path, input2_descr = testdata.create_testfile(
+        bbox=bbox,
+        geoms=12,
+        polys_per_geom=1,
+        points_per_poly=30_000,
+        poly_width=15_000,
+        poly_height=15_000,
+        crs=crs,
+        dst_dir=tmp_dir,
+        simplify_tolerance=_common.COMPLEXPOLYS_SIMPLIFY_TOLERANCE,
+    )
+
+    # Go!
+    # Read input files: only the geometries are needed to benchmark the geometry cost
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path], columns=[]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
+
+    # symmetric_difference
+    # The symmetric difference consists of the differences both ways, both based on
+    # the same intersecting pairs.
+    start_time_op = time.perf_counter()
+    input1_geoms = np.asarray(input1_gdf.geometry.array)
+    input2_geoms = np.asarray(input2_gdf.geometry.array)
+    # Query the tree on the parcels with the few complex polygons rather than the other
+    # way around: the query geometries are prepared to evaluate the predicate, so the
+    # expensive complex polygons are only prepared once. A prepared geometry indexes
+    # its edges, so the many parcels that only overlap its bounding box are rejected
+    # without a full polygon-polygon comparison.
+    input2_idx, input1_idx = _query_intersects(input2_geoms, input1_geoms)
+    with ThreadPoolExecutor(max_workers=_nb_parallel) as pool:
+        differences1 = _difference(
+            input1_geoms, input2_geoms, input1_idx, input2_idx, pool
+        )
+        differences2 = _difference(
+            input2_geoms, input1_geoms, input2_idx, input1_idx, pool
+        )
+    result_gdf = gpd.GeoDataFrame(
+        geometry=np.concatenate([differences1, differences2]), crs=input1_gdf.crs
+    )
+    logger.info(f"time for symmetric_difference: {time.perf_counter() - start_time_op}")
+
+    # Write to output file
+    start_time_write = time.perf_counter()
+    output_path = (
+        tmp_dir / f"{input1_path.stem}_symdif_{input2_path.stem}_{_package}.gpkg"
+    )
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation=function_name,
+        secs_taken=secs_taken,
+        operation_descr=f"{function_name} between {input1_descr} and {input2_descr}",
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details(
+                _common.complexpolys_run_details({"nb_cpu": _nb_parallel})
+            )
+        ),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
+
+
+def union(tmp_dir: Path) -> RunResult:
+    # Init
+    testdata.TestFile.AGRIPRC_2019.prefetch(tmp_dir)
+    input1_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    input2_path, _ = testdata.TestFile.AGRIPRC_2019.get_file(tmp_dir)
+
+    # Go!
+    # Read input files: only the geometries are needed to benchmark the geometry cost
+    (input1_gdf, input2_gdf), secs_read = _common.read_dataframes(
+        [input1_path, input2_path], columns=[]
+    )
+    logger.info(f"time for read: {secs_read}")
+    start_time = time.perf_counter()
+
+    # union
+    # The union consists of the intersections + the differences both ways. The
+    # intersecting pairs are determined once and used for all three of them.
+    start_time_op = time.perf_counter()
+    input1_geoms = np.asarray(input1_gdf.geometry.array)
+    input2_geoms = np.asarray(input2_gdf.geometry.array)
+    input1_idx, input2_idx = _query_intersects(input1_geoms, input2_geoms)
+    intersections = shapely.intersection(
+        input1_geoms[input1_idx], input2_geoms[input2_idx]
+    )
+    with ThreadPoolExecutor(max_workers=_nb_parallel) as pool:
+        differences1 = _difference(
+            input1_geoms, input2_geoms, input1_idx, input2_idx, pool
+        )
+        differences2 = _difference(
+            input2_geoms, input1_geoms, input2_idx, input1_idx, pool
+        )
+    result_gdf = gpd.GeoDataFrame(
+        geometry=np.concatenate(
+            [_keep_polygons(intersections), differences1, differences2]
+        ),
+        crs=input1_gdf.crs,
+    )
+    logger.info(f"time for union: {time.perf_counter() - start_time_op}")
+
+    # Write to output file
+    start_time_write = time.perf_counter()
+    output_path = (
+        tmp_dir / f"{input1_path.stem}_union_{input2_path.stem}_{_package}.gpkg"
+    )
+    output_path = _common.write_result(result_gdf, output_path)
+    logger.info(f"write took {time.perf_counter() - start_time_write}")
+    secs_taken = secs_read + time.perf_counter() - start_time
+    result = RunResult(
+        package=_package,
+        package_version=_package_version,
+        operation="union",
+        secs_taken=secs_taken,
+        operation_descr="union of 2 agri parcel layers BEFL (2*~500k polygons)",
+        run_details=_common.hilbert_sorted_run_details(
+            _common.output_run_details({"nb_cpu": _nb_parallel})
+        ),
+    )
+
+    # Cleanup and return
+    _common.remove_output(output_path)
+    return result
@@ -1 +1,93 @@
+from pathlib import Path
+from typing import Optional
+
+import pyogrio
+
+import testdata
+
 nb_polygons_for_test = 5000
+
+
+def get_sample_vector(tmp_dir: Path) -> tuple[Path, tuple[float, float, float, float]]:
+    """Get the sample of the agri parcels to calculate the zonal statistics for.
+
+    The sample is only written once and reused by all benchmarks afterwards.
+
+    Args:
+        tmp_dir (Path): the directory to write the sample to.
+
+    Returns:
+        tuple[Path, tuple[float, float, float, float]]: the path to the sample file +
+            its total bounds (minx, miny, maxx, maxy).
+    """
+    vector_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
+    sample_path = tmp_dir / f"{vector_path.stem}_sample_{nb_polygons_for_test}.gpkg"
+    if not sample_path.exists():
+        # max_features stops reading once the sample is complete
+        sample_gdf = pyogrio.read_dataframe(
+            vector_path, max_features=nb_polygons_for_test, use_arrow=True
+        )
+        pyogrio.write_dataframe(
+            sample_gdf,
+            sample_path,
+            use_arrow=True,
+            layer_options={"SPATIAL_INDEX": "NO"},
+        )
+
+    info = pyogrio.read_info(sample_path, force_total_bounds=True)
+    return sample_path, tuple(info["total_bounds"])
+
+
+def sample_raster_uri(
+    raster_path: Path,
+    bounds: tuple[float, float, float, float],
+    bands: Optional[list[int]] = None,
+    margin: float = 100,
+) -> str:
+    """Get a GDAL connection string exposing only the part of a raster within bounds.
+
+    Only a sample of the polygons is used in the benchmarks, so the engines don't need
+    to scan the raster outside of the sample. The vrt:// connection string (GDAL >= 3.8)
+    lets GDAL read the window straight from the original raster, so no clipped copy
+    needs to be written and no extra dependency is needed to support all engines.
+
+    Args:
+        raster_path (Path): the raster file.
+        bounds (tuple[float, float, float, float]): the bounds (minx, miny, maxx, maxy)
+            to expose, in the CRS of the raster.
+        bands (list[int], optional): the bands to expose. If None, all bands are
+            exposed. Defaults to None.
+        margin (float, optional): the margin to add around the bounds, so the
+            polygons at the edges of the sample are fully covered after snapping to
+            the pixel grid. Defaults to 100.
+
+    Returns:
+        str: the GDAL connection string.
+    """
+    minx, miny, maxx, maxy = bounds
+    projwin = [minx - margin, maxy + margin, maxx + margin, miny - margin]
+    options = [f"projwin={','.join(str(coord) for coord in projwin)}"]
+    if bands is not None:
+        options.append(f"bands={','.join(str(band) for band in bands)}")
+
+    return f"vrt://{raster_path.as_posix()}?{'&'.join(options)}"
+
+
+def hilbert_sorted_run_details(run_details: Optional[dict] = None) -> Optional[dict]:
+    """Add to the run details that the agri parcels are hilbert sorted if they are.
+
+    The sample is the first polygons of the file, so sorting it changes which polygons
+    are benchmarked. Results with the file in its original order don't get the extra
+    detail, so they stay comparable with the results of before it could be sorted.
+
+    Args:
+        run_details (dict, optional): the run details to add the detail to.
+            Defaults to None.
+
+    Returns:
+        Optional[dict]: the run details.
+    """
+    if not testdata.HILBERT_SORTED:
+        return run_details
+
+    return {**(run_details or {}), "hilbert_sorted": True}
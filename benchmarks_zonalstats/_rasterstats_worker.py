@@ -0,0 +1,49 @@
+"""
+Module with the functions the rasterstats benchmark runs in its worker processes.
+
+The workers are spawned, so they import the module of the functions they run. This
+module only imports what the workers need, so starting them stays cheap.
+"""
+
+from pathlib import Path
+
+import pyogrio
+import rasterstats
+
+
+def warm_up() -> None:
+    """Do nothing, so a worker process can be started before the benchmark starts."""
+
+
+def zonal_stats_batch(
+    vector_path: Path, skip_features: int, max_features: int, raster_uri: str
+) -> list[dict]:
+    """Calculate the zonal stats for a batch of the polygons in vector_path.
+
+    rasterio and rasterstats aren't thread-safe, so this is meant to run in a worker
+    process. Each worker reads its own batch of polygons, so they don't need to be
+    pickled to be sent to the worker.
+
+    Args:
+        vector_path (Path): the file with the polygons.
+        skip_features (int): the number of polygons to skip before the batch starts.
+        max_features (int): the maximum number of polygons in the batch.
+        raster_uri (str): the raster to calculate the zonal stats on.
+
+    Returns:
+        list[dict]: the zonal stats, one dict per polygon.
+    """
+    vector_gdf = pyogrio.read_dataframe(
+        vector_path,
+        skip_features=skip_features,
+        max_features=max_features,
+        use_arrow=True,
+    )
+    return list(
+        rasterstats.gen_zonal_stats(
+            vector_gdf,
+            raster_uri,
+            band=1,
+            stats=["count", "min", "max", "mean"],
+        )
+    )
@@ -2,12 +2,10 @@
 Module to benchmark zonalstats.
 """
 
-from datetime import datetime
 import logging
 from pathlib import Path
-from typing import List
+import time
 
-import geopandas as gpd
 import pygeoprocessing.geoprocessing
 
 from benchmarker import RunResult
@@ -25,28 +23,28 @@ def _get_version() -> str:
     return f"{pygeoprocessing.__version__}".replace("v", "")  # type: ignore
 
 
-def zonalstats_1band(tmp_dir: Path) -> List[RunResult]:
+def zonalstats_1band(tmp_dir: Path) -> list[RunResult]:
     # Init
     results = []
-    vector_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     raster_path, _ = testdata.TestFile.S2_NDVI_2020.get_file(tmp_dir)
 
-    # Prepare a sample of the parcels, otherwise to slow
+    # Use a sample of the parcels, otherwise to slow
     nb_poly = _common.nb_polygons_for_test
-    vector_gdf = gpd.read_file(vector_path, rows=slice(0, nb_poly))
-    vector_tmp_path = tmp_dir / "vector_input.gpkg"
-    vector_gdf.to_file(vector_tmp_path)
+    vector_tmp_path, vector_bounds = _common.get_sample_vector(tmp_dir)
+
+    # Only expose the part of the raster covered by the sample
+    raster_uri = _common.sample_raster_uri(raster_path, vector_bounds)
 
     # Go!
-    start_time = datetime.now()
+    start_time = time.perf_counter()
     #  1.000: 10s
     # 10.000: 97s
     stats = pygeoprocessing.geoprocessing.zonal_statistics(
-        (str(raster_path), 1), str(vector_tmp_path), polygons_might_overlap=True
+        (raster_uri, 1), str(vector_tmp_path), polygons_might_overlap=True
     )
     print(stats)
 
-    secs_taken = (datetime.now() - start_time).total_seconds()
+    secs_taken = time.perf_counter() - start_time
     results.append(
         RunResult(
             package=_get_package(),
@@ -56,7 +54,7 @@ def zonalstats_1band(tmp_dir: Path) -> List[RunResult]:
             operation_descr=(
                 f"zonalstats of agri parcels ({nb_poly} polygons) + S2 NDVI BEFL"
             ),
-            run_details={},
+            run_details=_common.hilbert_sorted_run_details({}),
         )
     )
 
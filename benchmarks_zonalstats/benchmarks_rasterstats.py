@@ -2,20 +2,24 @@
 Module to benchmark zonalstats.
 """
 
+from concurrent.futures import ProcessPoolExecutor
 import logging
-from datetime import datetime
+import math
+import multiprocessing
 from pathlib import Path
-from typing import List
+import time
 
-import geopandas as gpd
 import rasterstats
 
+import benchmarker
 from benchmarker import RunResult
-from benchmarks_zonalstats import _common
+from benchmarks_zonalstats import _common, _rasterstats_worker
 import testdata
 
 logger = logging.getLogger(__name__)
 
+_nb_parallel = benchmarker.cap_nb_parallel(12)
+
 
 def _get_package() -> str:
     return "rasterstats"
@@ -25,33 +29,48 @@ def _get_version() -> str:
     return f"{rasterstats.__version__}".replace("v", "")
 
 
-def zonalstats_1band(tmp_dir: Path) -> List[RunResult]:
+def zonalstats_1band(tmp_dir: Path) -> list[RunResult]:
     # Init
     results = []
-    vector_path, _ = testdata.TestFile.AGRIPRC_2018.get_file(tmp_dir)
     raster_path, _ = testdata.TestFile.S2_NDVI_2020.get_file(tmp_dir)
 
-    # Prepare a sample of the parcels, otherwise to slow
+    # Use a sample of the parcels, otherwise to slow
     nb_poly = _common.nb_polygons_for_test
-    vector_gdf = gpd.read_file(vector_path, rows=slice(0, nb_poly))
-    vector_tmp_path = tmp_dir / "vector_input.gpkg"
-    vector_gdf.to_file(vector_tmp_path)
-
-    # Go!
-    start_time = datetime.now()
-    #  1.000: 10s
-    # 10.000: 97s
-    stats = list(
-        rasterstats.gen_zonal_stats(
-            str(vector_tmp_path),
-            raster_path,
-            band=1,
-            stats=["count", "min", "max", "mean"],
+    vector_tmp_path, vector_bounds = _common.get_sample_vector(tmp_dir)
+
+    # Only expose the part of the raster covered by the sample
+    raster_uri = _common.sample_raster_uri(raster_path, vector_bounds)
+
+    # The polygons are independent, so process them in batches in parallel. Spawn the
+    # workers: the benchmarks that ran before in this process can have left threads
+    # holding e.g. GDAL or logging locks, which would deadlock a forked worker.
+    batch_size = math.ceil(nb_poly / _nb_parallel)
+    batch_starts = range(0, nb_poly, batch_size)
+    nb_batches = len(batch_starts)
+    stats = []
+    with ProcessPoolExecutor(
+        max_workers=nb_batches, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        # Start the workers and let them import rasterstats before the timing starts,
+        # so the interpreter startup isn't timed as zonal stats work.
+        warm_ups = [pool.submit(_rasterstats_worker.warm_up) for _ in batch_starts]
+        for warm_up in warm_ups:
+            warm_up.result()
+
+        # Go!
+        start_time = time.perf_counter()
+        batches = pool.map(
+            _rasterstats_worker.zonal_stats_batch,
+            [vector_tmp_path] * nb_batches,
+            batch_starts,
+            [batch_size] * nb_batches,
+            [raster_uri] * nb_batches,
         )
-    )
+        for batch_stats in batches:
+            stats.extend(batch_stats)
+        secs_taken = time.perf_counter() - start_time
     # print(stats)
 
-    secs_taken = (datetime.now() - start_time).total_seconds()
     results.append(
         RunResult(
             package=_get_package(),
@@ -61,7 +80,7 @@ def zonalstats_1band(tmp_dir: Path) -> List[RunResult]:
             operation_descr=(
                 f"zonalstats of agri parcels ({nb_poly} polygons) + S2 NDVI BEFL"
             ),
-            run_details={},
+            run_details=_common.hilbert_sorted_run_details({"nb_cpu": _nb_parallel}),
         )
     )
 
@@ -7,7 +7,7 @@ import math
 from pathlib import Path
 import shutil
 import tempfile
-from typing import Literal, Optional, Tuple
+from typing import Literal, Optional
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -118,7 +118,7 @@ def save_chart(
     yscale: Optional[Literal["linear", "log", "symlog", "logit"]] = None,
     y_value_formatter: Optional[str] = None,
     print_labels_on_points: bool = False,
-    size: Tuple[float, float] = (8, 4),
+    size: tuple[float, float] = (8, 4),
     plot_kind: Literal[
         "line",
         "bar",
@@ -149,7 +149,7 @@ def save_chart(
               - {0:.2f} for a float with two decimals.
             Defaults to None.
         print_labels_on_points (bool, optional): _description_. Defaults to False.
-        size (Tuple[float, float], optional): _description_. Defaults to (8, 4).
+        size (tuple[float, float], optional): _description_. Defaults to (8, 4).
         plot_kind (str, optional): _description_. Defaults to "line".
         gridlines (str, optional): where to draw grid lines:
 
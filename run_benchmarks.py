@@ -0,0 +1,55 @@
+"""
+Script to run a suite of benchmarks.
+
+Examples:
+    Run all vector ops benchmarks::
+
+        python run_benchmarks.py vector_ops
+
+    Only run specific benchmark modules/function(s)::
+
+        python run_benchmarks.py vector_ops --modules benchmarks_geopandas
+        python run_benchmarks.py IO --functions write_dataframe
+"""
+
+import argparse
+from pathlib import Path
+
+import benchmarker
+
+# The benchmark suites available, with the directories of their benchmarks and results
+SUITES = {
+    "IO": {"benchmarks_subdir": "benchmarks_IO", "results_subdir": "results_IO"},
+    "vector_ops": {
+        "benchmarks_subdir": "benchmarks_vector_ops",
+        "results_subdir": "results_vector_ops",
+    },
+    "zonalstats": {
+        "benchmarks_subdir": "benchmarks_zonalstats",
+        "results_subdir": "results_zonalstats",
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a suite of benchmarks.")
+    parser.add_argument("suite", choices=list(SUITES), help="the suite to run")
+    parser.add_argument("--modules", nargs="+", help="only run these benchmark modules")
+    parser.add_argument(
+        "--functions", nargs="+", help="only run these benchmark functions"
+    )
+    parser.add_argument(
+        "--tmp_dir", type=Path, help="the dir for the test data and the output files"
+    )
+    args = parser.parse_args()
+
+    benchmarker.run_benchmarks(
+        **SUITES[args.suite],
+        modules=args.modules,
+        functions=args.functions,
+        tmp_dir=args.tmp_dir,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,21 @@
 
 import enum
 import logging
+import os
 import pprint
 import shutil
+import sqlite3
 import tempfile
+import threading
 import urllib.request
 import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Union
 
 import geopandas as gpd
+import numpy as np
+import pyogrio
 import pyproj
 import shapely
 import shapely.affinity
@@ -19,6 +25,18 @@ import geofileops as gfo
 
 logger = logging.getLogger(__name__)
 
+# If set, the vector test files are sorted along a Hilbert curve before they are used,
+# so features that are close to each other are also close to each other in the file.
+# Can be set with the GEOBENCHMARK_HILBERT_SORTED environment variable. By default the
+# original order is kept, so the results stay comparable with earlier runs.
+HILBERT_SORTED = os.environ.get("GEOBENCHMARK_HILBERT_SORTED", "0") == "1"
+
+# The test files are prepared in background threads, so e.g. the download of one file
+# can overlap with the preparation of another one.
+_prepare_executor = ThreadPoolExecutor(max_workers=2)
+_prepare_futures: dict[tuple["TestFile", Path], Future] = {}
+_prepare_lock = threading.Lock()
+
 
 class TestFile(enum.Enum):
     """Class to create benchmarking test files.
@@ -70,21 +88,62 @@ class TestFile(enum.Enum):
     def get_file(self, output_dir: Path) -> tuple[Path, str]:
         """Creates the test file.
 
+        If the file is being prepared in the background already, see `prefetch`, it
+        waits till it is ready.
+
         Args:
             output_dir (Path): the directory to write the file to.
 
         Returns:
             tuple[Path, str]: The path to the file + a description of the test file.
         """
+        return self.prefetch(output_dir).result()
+
+    def prefetch(self, output_dir: Path) -> Future:
+        """Start preparing the test file in the background if this wasn't done yet.
+
+        Calling this before `get_file` is called for another test file lets them be
+        prepared at the same time.
+
+        Args:
+            output_dir (Path): the directory to write the file to.
+
+        Returns:
+            Future: the future with the result of `get_file`.
+        """
+        key = (self, output_dir)
+        with _prepare_lock:
+            future = _prepare_futures.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = _prepare_executor.submit(self._prepare_file, output_dir)
+                _prepare_futures[key] = future
+
+        return future
+
+    def _prepare_file(self, output_dir: Path) -> tuple[Path, str]:
         testfile_path = _download_samplefile(
             url=self.url, dst_name=self.filename, dst_dir=output_dir
         )
+        if HILBERT_SORTED and testfile_path.suffix.lower() == ".gpkg":
+            testfile_path = _hilbert_sort(testfile_path)
+        # Make sure the file has a spatial index, so the benchmarks don't need to build
+        # one on the fly or run without it. It is only created once, as the file is
+        # reused by all benchmarks.
+        if testfile_path.suffix.lower() == ".gpkg" and not gfo.has_spatial_index(
+            testfile_path
+        ):
+            logger.info(f"create spatial index on {testfile_path}")
+            gfo.create_spatial_index(testfile_path)
+        if testfile_path.suffix.lower() == ".gpkg":
+            _analyze_gpkg(testfile_path)
         testfile_info = gfo.get_layerinfo(testfile_path)
         logger.debug(
             f"TestFile {self.name} contains {testfile_info.featurecount} rows."
         )
         count_kilo = f"{int(testfile_info.featurecount / 1000)}k"
         description = f"agri parcels ({count_kilo} polys)"
+        if HILBERT_SORTED:
+            description = f"{description}, hilbert sorted"
 
         return (testfile_path, description)
 
@@ -98,6 +157,7 @@ def create_testfile(
     poly_height: float = 30_000,
     crs: Union[int, str, pyproj.CRS, None] = None,
     dst_dir: Optional[Path] = None,
+    simplify_tolerance: Optional[float] = None,
 ) -> tuple[Path, str]:
     """Creates a test file.
 
@@ -112,6 +172,8 @@ def create_testfile(
         poly_height (float): the height of the polygons. Defaults to 30000.
         crs (str): the crs of the test file. Defaults to None.
         dst_dir (Path): the directory to write the file to.
+        simplify_tolerance (float, optional): if specified, the polygons are simplified
+            with this tolerance, preserving topology. Defaults to None.
 
     Returns:
         tuple[Path, str]: The path to the file + a description of the test file.
@@ -122,6 +184,8 @@ def create_testfile(
         poly_str = f"{geoms}polys({points_per_poly}pnts)"
     else:
         poly_str = f"{geoms}multis({polys_per_geom}polys({points_per_poly}pnts))"
+    if simplify_tolerance is not None:
+        poly_str = f"{poly_str}_simplified{simplify_tolerance}"
     basename = f"testfile_{poly_str}_{bbox[0]}-{bbox[1]}-{bbox[2]}-{bbox[3]}.gpkg"
     testfile_path = _prepare_dst_path(basename, dst_dir=dst_dir)
 
@@ -135,6 +199,8 @@ def create_testfile(
         descr = f"{geoms} polys of {nb_points_str} coords"
     else:
         descr = f"{geoms} multipolys of {polys_per_geom} * {nb_points_str} coords"
+    if simplify_tolerance is not None:
+        descr = f"{descr}, simplified with tolerance {simplify_tolerance}"
 
     # If the files exists already, return
     if testfile_path.exists():
@@ -174,6 +240,13 @@ def create_testfile(
         height=poly_height,
         nb_points=points_per_poly,
     )
+    if simplify_tolerance is not None:
+        nb_points_orig = shapely.get_num_coordinates(poly).item()
+        poly = shapely.simplify(poly, simplify_tolerance, preserve_topology=True)
+        logger.info(
+            f"simplified poly_complex with {simplify_tolerance=} from "
+            f"{nb_points_orig} to {shapely.get_num_coordinates(poly).item()} points"
+        )
 
     # Create the polygons. If many are asked, they can overlap, but for performance
     # testing that should not matter.
@@ -202,8 +275,15 @@ def create_testfile(
         result.append(shapely.MultiPolygon(polys))
 
     # Write all geometries to a file
+    # Write them directly with pyogrio in one go, with a spatial index, as it is used as
+    # input for the benchmarks.
     complex_gdf = gpd.GeoDataFrame(geometry=result, crs=crs)
-    complex_gdf.to_file(testfile_path, engine="pyogrio")
+    pyogrio.write_dataframe(
+        complex_gdf,
+        testfile_path,
+        driver="GPKG",
+        layer_options={"SPATIAL_INDEX": "YES"},
+    )
 
     return (testfile_path, descr)
 
@@ -347,26 +427,22 @@ def _create_complex_square_poly(
     max_segment_length: int,
 ) -> shapely.Polygon:
     """Create complex square polygon of a ~grid-shape the size specified."""
-    lines = []
     height = width
 
-    # Vertical lines
-    for x_offset in range(0, 0 + int(width), line_distance):
-        lines.append(
-            shapely.LineString(
-                [(xmin + x_offset, ymin), (xmin + x_offset, ymin + height)]
-            )
-        )
-
-    # Horizontal lines
-    for y_offset in range(0, 0 + int(height), line_distance):
-        lines.append(
-            shapely.LineString(
-                [(xmin, ymin + y_offset), (xmin + width, ymin + y_offset)]
-            )
-        )
-
-    poly_complex = shapely.unary_union(shapely.MultiLineString(lines).buffer(2))
+    # Create the coordinates of all lines at once: shape (nb_lines, 2 points, xy)
+    x_offsets = np.arange(0, int(width), line_distance, dtype=np.float64)
+    y_offsets = np.arange(0, int(height), line_distance, dtype=np.float64)
+    vertical = np.empty((len(x_offsets), 2, 2))
+    vertical[:, :, 0] = (xmin + x_offsets)[:, np.newaxis]
+    vertical[:, 0, 1] = ymin
+    vertical[:, 1, 1] = ymin + height
+    horizontal = np.empty((len(y_offsets), 2, 2))
+    horizontal[:, 0, 0] = xmin
+    horizontal[:, 1, 0] = xmin + width
+    horizontal[:, :, 1] = (ymin + y_offsets)[:, np.newaxis]
+    lines = shapely.linestrings(np.concatenate([vertical, horizontal]))
+
+    poly_complex = shapely.unary_union(shapely.multilinestrings(lines).buffer(2))
     poly_complex = shapely.segmentize(
         poly_complex, max_segment_length=max_segment_length
     )
@@ -407,25 +483,25 @@ def _download_samplefile(
     if url_path.suffix.lower() == dst_path.suffix.lower():
         logger.info(f"Download/copy to {dst_path}")
         if url.startswith("http"):
-            urllib.request.urlretrieve(url, dst_path)
+            _download(url, dst_path)
         else:
             shutil.copy(url, dst_path)
     else:
         # The file downloaded is different that the destination wanted, so some
         # converting will need to be done
-        tmp_dir = dst_path.parent / "tmp"
+        # Use a tmp dir per file, as multiple files can be prepared at the same time
+        tmp_dir = dst_path.parent / f"tmp_{dst_path.stem}"
 
         try:
             # Remove tmp dir if it exists already
-            if tmp_dir.exists():
-                shutil.rmtree(tmp_dir)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
             tmp_dir.mkdir(parents=True, exist_ok=True)
 
             # Download file
             tmp_path = tmp_dir / f"{dst_path.stem}{url_path.suffix.lower()}"
             logger.info(f"Download/copy tmp data to {tmp_path}")
             if url.startswith("http"):
-                urllib.request.urlretrieve(url, tmp_path)
+                _download(url, tmp_path)
             else:
                 shutil.copy(url, tmp_path)
 
@@ -434,13 +510,15 @@ def _download_samplefile(
                 # Unzip
                 unzippedzip_dir = dst_path.parent / tmp_path.stem
                 logger.info(f"Unzip to {unzippedzip_dir}")
-                with zipfile.ZipFile(tmp_path, "r") as zip_ref:
-                    zip_ref.extractall(unzippedzip_dir)
-
-                # Look for the file
-                tmp_paths = []
-                for suffix in [".shp", ".gpkg"]:
-                    tmp_paths.extend(list(unzippedzip_dir.rglob(f"*{suffix}")))
+                _extract_zip(tmp_path, unzippedzip_dir)
+
+                # Look for the file, walking the extracted files only once
+                tmp_paths = [
+                    Path(root) / name
+                    for root, _, names in os.walk(unzippedzip_dir)
+                    for name in names
+                    if name.lower().endswith((".shp", ".gpkg"))
+                ]
                 if len(tmp_paths) == 1:
                     tmp_path = tmp_paths[0]
                 else:
@@ -460,6 +538,113 @@ def _download_samplefile(
     return dst_path
 
 
+def _download(url: str, dst_path: Path):
+    """Download the url to dst_path.
+
+    The data is copied in chunks of 1 MiB instead of the 8 KiB urlretrieve uses, so
+    large files need far fewer reads and writes.
+
+    Args:
+        url (str): the url to download.
+        dst_path (Path): the file to write to.
+    """
+    with urllib.request.urlopen(url) as response, open(dst_path, "wb") as dst:
+        shutil.copyfileobj(response, dst, length=1024 * 1024)
+
+
+def _extract_zip(zip_path: Path, dst_dir: Path):
+    """Extract all files in the zip file to dst_dir.
+
+    The files are decompressed in parallel threads: zlib releases the GIL while
+    decompressing. Every file is extracted with its own ZipFile, as a ZipFile can't be
+    read from multiple threads at the same time.
+
+    Args:
+        zip_path (Path): the zip file.
+        dst_dir (Path): the directory to extract the files to.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        infos = zip_ref.infolist()
+        names = [info.filename for info in infos if not info.is_dir()]
+        if len(names) <= 1:
+            zip_ref.extractall(dst_dir)
+            return
+
+        # Create the directories upfront, so the threads don't race to create them
+        for info in infos:
+            if info.is_dir():
+                zip_ref.extract(info, dst_dir)
+        for name in names:
+            (dst_dir / name).parent.mkdir(parents=True, exist_ok=True)
+
+    def extract(name: str):
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            zip_ref.extract(name, dst_dir)
+
+    nb_workers = min(len(names), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=nb_workers) as pool:
+        list(pool.map(extract, names))
+
+
+def _hilbert_sort(path: Path) -> Path:
+    """Create a copy of the file with the features sorted along a Hilbert curve.
+
+    The sorted copy is only created once, next to the original file.
+
+    Args:
+        path (Path): the file to sort.
+
+    Returns:
+        Path: the path to the sorted copy.
+    """
+    sorted_path = path.with_name(f"{path.stem}_hilbert{path.suffix}")
+    if sorted_path.exists():
+        return sorted_path
+
+    logger.info(f"Sort {path} along a hilbert curve to {sorted_path}")
+    gdf = pyogrio.read_dataframe(path, use_arrow=True)
+    gdf = gdf.iloc[np.argsort(gdf.geometry.hilbert_distance(), kind="stable")]
+
+    # Write to a tmp file first, so no partial file remains if something goes wrong
+    tmp_path = sorted_path.with_name(f"{sorted_path.stem}_tmp{sorted_path.suffix}")
+    pyogrio.write_dataframe(
+        gdf,
+        tmp_path,
+        layer=sorted_path.stem,
+        driver="GPKG",
+        use_arrow=True,
+        layer_options={"SPATIAL_INDEX": "YES"},
+    )
+    gfo.move(tmp_path, sorted_path)
+
+    return sorted_path
+
+
+def _analyze_gpkg(path: Path):
+    """Vacuum and analyze the GPKG file if it wasn't analyzed before.
+
+    Without statistics, the SQLite query planner can choose a full table scan instead
+    of using the spatial index for some queries, so the timings of the benchmarks
+    depend on the history of the file. This is only done once: afterwards the
+    statistics are stored in the file.
+
+    Args:
+        path (Path): the GPKG file.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        sql = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'"
+        if conn.execute(sql).fetchone() is not None:
+            return
+
+        logger.info(f"vacuum and analyze {path}")
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
 def _prepare_dst_path(dst_name: str, dst_dir: Optional[Path] = None):
     if dst_dir is None:
         return Path(tempfile.gettempdir()) / "geofileops_sampledata" / dst_name